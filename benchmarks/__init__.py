@@ -0,0 +1,9 @@
+"""
+Benchmarks of django-billjobs hot paths.
+
+Each benchmark creates its own test database with the project settings, use
+DJANGO_SETTINGS_MODULE to run them against another database backend::
+
+    python -m benchmarks.bill_number
+    DJANGO_SETTINGS_MODULE=mysite.settings python -m benchmarks.bill_number
+"""
@@ -0,0 +1,66 @@
+"""
+Concurrent bill creation, check no bill number is given twice.
+
+    python -m benchmarks.bill_number --writers 16 --bills 50
+"""
+import argparse
+import threading
+from .utils import setup_django, test_database, timer
+
+
+def create_bills(user_id, count, errors):
+    from django.db import connection
+    from billjobs.models import Bill
+    try:
+        for i in range(count):
+            Bill.objects.create(user_id=user_id, billing_address='address')
+    except Exception as e:
+        errors.append(e)
+    finally:
+        connection.close()
+
+
+def run(writers, bills):
+    from django.contrib.auth.models import User
+    from billjobs.models import Bill
+
+    user = User.objects.create(username='bench-numbers')
+    errors = []
+    threads = [
+            threading.Thread(target=create_bills,
+                args=(user.id, bills, errors))
+            for i in range(writers)]
+    results = {}
+    with timer(results, 'seconds'):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    numbers = list(Bill.objects.values_list('number', flat=True))
+    results.update(
+            writers=writers,
+            bills=len(numbers),
+            duplicates=len(numbers) - len(set(numbers)),
+            errors=[repr(e) for e in errors],
+            bills_per_second=len(numbers) / results['seconds'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--bills', type=int, default=50,
+            help='bills created by each writer')
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        results = run(args.writers, args.bills)
+    for key, value in sorted(results.items()):
+        print('{}: {}'.format(key, value))
+    if results['duplicates'] or results['errors']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
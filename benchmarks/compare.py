@@ -0,0 +1,49 @@
+"""
+Compare timings of two benchmark suite results.
+
+Exit with status 1 when a timing is slower than the threshold ratio.
+
+    python -m benchmarks.compare before.json after.json --threshold 1.2
+"""
+import argparse
+import json
+
+
+def timings(results, prefix=''):
+    """ Yield (path, milliseconds) of every mean timing in results """
+    for key, value in sorted(results.items()):
+        path = '{}.{}'.format(prefix, key) if prefix else key
+        if isinstance(value, dict):
+            for timing in timings(value, path):
+                yield timing
+        elif key in ('mean_ms', 'seconds'):
+            yield path, value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2,
+            help='slowdown ratio reported as a regression')
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = dict(timings(json.load(f)['results']))
+    with open(args.after) as f:
+        after = dict(timings(json.load(f)['results']))
+
+    regressions = 0
+    for path in sorted(set(before) & set(after)):
+        ratio = after[path] / before[path] if before[path] else float('inf')
+        regression = ratio > args.threshold
+        regressions += regression
+        print('{:<45} {:>10.2f} {:>10.2f} {:>6.2f}x{}'.format(
+            path, before[path], after[path], ratio,
+            ' REGRESSION' if regression else ''))
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
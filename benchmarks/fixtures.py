@@ -0,0 +1,65 @@
+"""
+Synthetic billing data for benchmarks.
+"""
+
+
+def create_user(username='bench'):
+    from django.contrib.auth.models import User
+    from billjobs.models import UserProfile
+    user = User.objects.create(username=username, first_name='Bench',
+            last_name=username.capitalize())
+    UserProfile.objects.create(user=user,
+            billing_address='1 rue du Benchmark\n34000 Montpellier')
+    return user
+
+
+def create_users(count, prefix='bench'):
+    """ Create users with a profile, with a few bulk inserts """
+    from django.contrib.auth.models import User
+    from billjobs.models import UserProfile
+    User.objects.bulk_create(
+            User(username='%s%d' % (prefix, i), first_name='Bench',
+                last_name=str(i), email='%s%d@example.org' % (prefix, i))
+            for i in range(count))
+    users = list(User.objects.filter(username__startswith=prefix))
+    UserProfile.objects.bulk_create(
+            UserProfile(user=user, billing_address='1 rue du Benchmark')
+            for user in users)
+    return users
+
+
+def create_services(count=10):
+    from billjobs.models import Service
+    return [Service.objects.create(
+        reference='S%03d' % i,
+        name='Service %d' % i,
+        description='Description of service %d, which is long enough to '
+        'wrap on two lines of the invoice table.' % i,
+        price=10 + i) for i in range(count)]
+
+
+def create_bill(user, services, lines):
+    """ Create a bill with lines through the signal chain """
+    from billjobs.models import Bill, BillLine, defer_bill_amount
+    bill = Bill.objects.create(user=user)
+    with defer_bill_amount():
+        for i in range(lines):
+            BillLine.objects.create(bill=bill,
+                    service=services[i % len(services)], quantity=1 + i % 3)
+    return bill
+
+
+def create_monthly_bills(users, services, period='2017-11'):
+    """ Create one bill with a line per service for each user, in bulk """
+    from billjobs.billing import generate_bills
+    from billjobs.models import Subscription
+    Subscription.objects.bulk_create(
+            Subscription(user=user, service=service)
+            for user in users for service in services)
+    return generate_bills(period)
+
+
+def load_bill(bill_id):
+    """ Load invoice snapshot of a bill the way generate_pdf does """
+    from billjobs.invoice import Invoice
+    return Invoice.load(bill_id)
@@ -0,0 +1,49 @@
+"""
+Monthly bills generation of many subscriptions.
+
+    python -m benchmarks.generate_bills --subscriptions 50000
+"""
+import argparse
+from .utils import setup_django, test_database, timer
+
+
+def run(subscriptions, services_per_user, batch_size):
+    from billjobs.billing import generate_bills
+    from billjobs.models import Bill, BillLine, Subscription
+    from .fixtures import create_services, create_users
+
+    services = create_services()
+    users = create_users(subscriptions // services_per_user)
+    Subscription.objects.bulk_create(
+            Subscription(user=user, service=services[i % len(services)])
+            for user in users for i in range(services_per_user))
+
+    results = {}
+    with timer(results, 'seconds'):
+        generate_bills('2017-11', batch_size)
+    with timer(results, 'second_run_seconds'):
+        generate_bills('2017-11', batch_size)
+    results.update(
+            subscriptions=Subscription.objects.count(),
+            bills=Bill.objects.count(),
+            lines=BillLine.objects.count(),
+            subscriptions_per_second=subscriptions / results['seconds'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscriptions', type=int, default=50000)
+    parser.add_argument('--services-per-user', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        results = run(args.subscriptions, args.services_per_user,
+                args.batch_size)
+    for key, value in sorted(results.items()):
+        print('{}: {}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
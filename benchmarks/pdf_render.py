@@ -0,0 +1,72 @@
+"""
+Invoice rendering time and memory for bills of many sizes.
+
+Each size is rendered with a template built for each invoice, as before
+templates were shared, and with the template shared by the process.
+
+    python -m benchmarks.pdf_render --lines 10 100 2000 --repeat 5
+"""
+import argparse
+import time
+import tracemalloc
+from .fixtures import create_user, create_services, create_bill, load_bill
+from .utils import setup_django, test_database
+
+
+def per_invoice(func, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def peak_memory(func):
+    """ Return peak memory allocated by func in bytes """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(lines, repeat):
+    from billjobs.pdf import InvoiceTemplate, get_invoice_template
+
+    user = create_user()
+    services = create_services()
+    template = get_invoice_template()
+    results = []
+    for count in lines:
+        bill = load_bill(create_bill(user, services, count).id)
+        # warm up fonts and module level caches of reportlab
+        content = template.render(bill)
+        cold = per_invoice(lambda: InvoiceTemplate().render(bill), repeat)
+        shared = per_invoice(lambda: template.render(bill), repeat)
+        results.append({
+            'lines': count,
+            'repeat': repeat,
+            'pdf_bytes': len(content),
+            'template_per_invoice_ms': cold * 1000,
+            'shared_template_ms': shared * 1000,
+            'peak_memory_bytes': peak_memory(lambda: template.render(bill)),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, nargs='+',
+            default=[10, 100, 2000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    setup_django()
+    with test_database():
+        results = run(args.lines, args.repeat)
+    for result in results:
+        print(', '.join('{}: {}'.format(key, value)
+            for key, value in sorted(result.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Run every benchmark of billing hot paths and write results as JSON.
+
+Synthetic data is created in a temporary SQLite file, or in the test
+database of your settings, with sizes given by options. Compare results of
+two commits with benchmarks.compare.
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --bills 2000 --users 5000 --output after.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+from . import bill_number
+from .fixtures import create_bill, create_monthly_bills, create_services, \
+        create_user, create_users
+from .utils import setup_django, test_database
+
+
+def measure(func, repeat):
+    """ Return mean, min and max milliseconds of func calls """
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+            'mean_ms': sum(timings) / repeat,
+            'min_ms': min(timings),
+            'max_ms': max(timings),
+            'repeat': repeat,
+            }
+
+
+def count_queries(func):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        func()
+    return len(queries)
+
+
+def bill_creation(args, user, services):
+    """ Bill and its lines saved one by one through the signal chain """
+    results = {}
+    for lines in args.bill_lines:
+        create = lambda: create_bill(user, services, lines)
+        results['{}_lines'.format(lines)] = dict(
+                measure(create, args.repeat), queries=count_queries(create))
+    return results
+
+
+def define_number(args):
+    """ Bills created by concurrent writers, numbers must stay unique """
+    return bill_number.run(args.writers, args.numbers)
+
+
+def generate_pdf(args, client, user, services):
+    """ Invoice download, rendered and from the pdf cache """
+    from billjobs.cache import get_pdf_cache
+    results = {}
+    for lines in args.pdf_lines:
+        url = '/billjobs/generate_pdf/{}'.format(
+                create_bill(user, services, lines).id)
+
+        def render():
+            get_pdf_cache().clear()
+            assert client.get(url).status_code == 200
+
+        render()
+        results['{}_lines'.format(lines)] = {
+                'rendered': measure(render, args.repeat),
+                'cached': measure(lambda: client.get(url), args.repeat),
+                'pdf_bytes': len(client.get(url).content),
+                }
+    return results
+
+
+def changelist(args, client):
+    """ BillAdmin list view, with a page of bills among many """
+    from billjobs.models import Bill
+    get = lambda: client.get('/admin/billjobs/bill/')
+    return dict(measure(get, args.repeat), queries=count_queries(get),
+            bills=Bill.objects.count())
+
+
+def email_export(args, client):
+    """ UserAdmin email action, streamed csv of every user """
+    from django.contrib.auth.models import User
+    # select all users across pages, like the admin link does
+    data = {
+            'action': 'export_email',
+            'select_across': '1',
+            '_selected_action': User.objects.values_list('pk', flat=True)[0],
+            }
+
+    def export():
+        response = client.post('/admin/auth/user/', data)
+        return b''.join(response.streaming_content)
+
+    return dict(measure(export, args.repeat), queries=count_queries(export),
+            users=User.objects.count(), csv_bytes=len(export()))
+
+
+def run(args):
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    admin = User.objects.create_superuser('bench-admin',
+            'admin@example.org', 'bench')
+    client = Client()
+    client.force_login(admin)
+    user = create_user()
+    services = create_services()
+
+    results = {}
+    results['bill_creation'] = bill_creation(args, user, services)
+    results['define_number'] = define_number(args)
+    results['generate_pdf'] = generate_pdf(args, client, user, services)
+    create_monthly_bills(create_users(args.bills, 'bench-bill'), services[:2])
+    results['changelist'] = changelist(args, client)
+    create_users(max(args.users - User.objects.count(), 0), 'bench-user')
+    results['email_export'] = email_export(args, client)
+    return results
+
+
+def metadata(args):
+    import django
+    from django.db import connection
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+            'commit': commit,
+            'date': datetime.datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': vars(args),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help='JSON file, default is stdout')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--bill-lines', type=int, nargs='+', default=[1, 10],
+            help='lines of bills created through signals')
+    parser.add_argument('--pdf-lines', type=int, nargs='+',
+            default=[1, 50, 500], help='lines of downloaded invoices')
+    parser.add_argument('--writers', type=int, default=8,
+            help='concurrent writers creating bills')
+    parser.add_argument('--numbers', type=int, default=25,
+            help='bills created by each writer')
+    parser.add_argument('--bills', type=int, default=1000,
+            help='bills in the admin list')
+    parser.add_argument('--users', type=int, default=2000,
+            help='users in the email export')
+    args = parser.parse_args()
+    setup_django()
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    with test_database():
+        results = {'meta': metadata(args), 'results': run(args)}
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if results['results']['define_number']['duplicates']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """ Configure django with the project settings """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    import django
+    from django.conf import settings
+    django.setup()
+    # like the test runner, do not record every query
+    settings.DEBUG = False
+
+
+@contextmanager
+def test_database():
+    """ Create a migrated test database and destroy it on exit
+
+    SQLite test database is a temporary file instead of memory, so threads
+    share the same database.
+    """
+    from django.db import connection
+    tmp_dir = None
+    if connection.vendor == 'sqlite':
+        tmp_dir = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tmp_dir, 'benchmark.sqlite3')
+        connection.settings_dict['OPTIONS'].setdefault('timeout', 60)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+            serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmp_dir is not None:
+            os.rmdir(tmp_dir)
+
+
+@contextmanager
+def timer(results, name):
+    """ Store elapsed seconds of the block in results[name] """
+    start = time.perf_counter()
+    yield
+    results[name] = time.perf_counter() - start
@@ -1,34 +1,82 @@
-import csv
 from django import forms
-from django.http import HttpResponse
-from django.db.models import Q
+from django.conf.urls import url
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.db.models import Q, Value
+from django.db.models.functions import Concat
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserChangeForm
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
 from django.core.urlresolvers import reverse
 from django.forms.models import BaseInlineFormSet
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
-from .models import Bill, BillLine, Service, UserProfile
+from .export import bills_pdf_zip, emails_csv, ledger_csv
+from .models import Bill, BillLine, Service, Subscription, \
+        UserBillingSummary, UserProfile, defer_bill_amount
+from .reports import add_months, parse_period, revenue_by_coworker, \
+        revenue_by_month, revenue_by_service, unpaid_aging
+from .settings import BILLJOBS_PDF_EXPORT_PROCESSES
+import datetime
+
+def get_service_choices():
+    ''' Return (id, name) of available services '''
+    return [(service.id, str(service)) for service in
+            Service.objects.filter(is_available=True).order_by('id')]
 
 class BillLineInlineForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
+        service_choices = kwargs.pop('service_choices', None)
         super(BillLineInlineForm, self).__init__(*args, **kwargs)
+        if service_choices is None:
+            service_choices = get_service_choices()
+        choices = list(service_choices)
+
+        field = self.fields['service']
         if self.instance.id:
-            self.fields['service'].queryset = Service.objects.filter(Q(is_available=True) | Q(name=self.instance.service.name))
-            print(self.fields['service'].choices)
+            field.queryset = Service.objects.filter(
+                    Q(is_available=True) | Q(pk=self.instance.service_id))
+            # keep service of existing line even if it is not available
+            if self.instance.service_id not in dict(choices):
+                choices.append(
+                        (self.instance.service_id, str(self.instance.service)))
         else:
-            self.fields['service'].queryset = Service.objects.filter(is_available=True)
+            field.queryset = Service.objects.filter(is_available=True)
+        # queryset is only used to validate submitted service
+        field.choices = [('', field.empty_label)] + choices
+        # admin wraps the select widget to add related links
+        getattr(field.widget, 'widget', field.widget).choices = field.choices
 
     class Meta:
         model = BillLine
         fields = ('service', 'quantity', 'total', 'note')
 
+class BillLineInlineFormSet(BaseInlineFormSet):
+    """
+    Load available services once for all forms of the formset, with a
+    single query read by every process
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(BillLineInlineFormSet, self).__init__(*args, **kwargs)
+        self.service_choices = get_service_choices()
+
+    def get_form_kwargs(self, index):
+        kwargs = super(BillLineInlineFormSet, self).get_form_kwargs(index)
+        kwargs['service_choices'] = self.service_choices
+        return kwargs
+
 class BillLineInline(admin.TabularInline):
     model = BillLine
     extra = 1
     form = BillLineInlineForm
+    formset = BillLineInlineFormSet
+
+    def get_queryset(self, request):
+        return super(BillLineInline, self).get_queryset(request) \
+                .select_related('service')
 
 
 class BillAdmin(admin.ModelAdmin):
@@ -40,6 +88,44 @@ class BillAdmin(admin.ModelAdmin):
     list_editable = ('isPaid',)
     list_filter = ('isPaid', )
     search_fields = ('user__first_name', 'user__last_name', 'number', 'amount')
+    actions = ['export_pdf', 'export_ledger']
+
+    def get_urls(self):
+        return [
+                url(r'^reports/$', self.admin_site.admin_view(self.reports),
+                    name='billjobs_bill_reports'),
+                ] + super(BillAdmin, self).get_urls()
+
+    def reports(self, request):
+        """ Revenue of a month by service and coworker, of the five years
+        before it by month, and unpaid bills by age
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        today = datetime.date.today()
+        period = request.GET.get('period', '')
+        try:
+            parse_period(period)
+        except ValueError:
+            period = today.strftime('%Y-%m')
+        context = dict(
+                self.admin_site.each_context(request),
+                title=_('Reports'),
+                opts=self.model._meta,
+                period=period,
+                months=revenue_by_month(add_months(period, -59), period),
+                services=revenue_by_service(period),
+                coworkers=revenue_by_coworker(period),
+                aging=unpaid_aging(today),
+                )
+        return TemplateResponse(
+                request, 'admin/billjobs/bill/reports.html', context)
+
+    def get_queryset(self, request):
+        """ Add coworker name so list view does not query each bill user """
+        return super(BillAdmin, self).get_queryset(request).annotate(
+                coworker_full_name=Concat(
+                    'user__first_name', Value(' '), 'user__last_name'))
 
     def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
         field = super(BillAdmin, self).formfield_for_foreignkey(
@@ -49,6 +135,12 @@ class BillAdmin(admin.ModelAdmin):
             field.label_from_instance = self.get_user_label
         return field
 
+    def save_related(self, request, form, formsets, change):
+        """ Compute bill amount once after all inline lines are saved """
+        with defer_bill_amount():
+            super(BillAdmin, self).save_related(
+                    request, form, formsets, change)
+
     def get_user_label(self, user):
         name = user.get_full_name()
         username = user.username
@@ -59,8 +151,8 @@ class BillAdmin(admin.ModelAdmin):
         ''' Create a link to user admin edit view '''
         return format_html(
                 '<a href="{}">{}</a>',
-                reverse('admin:auth_user_change', args=(obj.user.id,)),
-                obj.coworker_name())
+                reverse('admin:auth_user_change', args=(obj.user_id,)),
+                obj.coworker_full_name)
     coworker_name_link.short_description = _('Coworker name')
 
     def pdf_file_url(self, obj):
@@ -70,6 +162,23 @@ class BillAdmin(admin.ModelAdmin):
                 obj.number)
     pdf_file_url.short_description=_('Download invoice')
 
+    def export_pdf(self, request, queryset):
+        """ Export invoices of selected bills in a zip archive """
+        response = StreamingHttpResponse(
+                bills_pdf_zip(queryset, BILLJOBS_PDF_EXPORT_PROCESSES),
+                content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="invoices.zip"'
+        return response
+    export_pdf.short_description = _('Export invoices of selected bills')
+
+    def export_ledger(self, request, queryset):
+        """ Export lines of selected bills in a csv accounting ledger """
+        response = StreamingHttpResponse(ledger_csv(queryset),
+                content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="ledger.csv"'
+        return response
+    export_ledger.short_description = _('Export ledger of selected bills')
+
 class RequiredInlineFormSet(BaseInlineFormSet):
     """
     Generates an inline formset that is required
@@ -114,18 +223,48 @@ class UserAdmin(UserAdmin):
                 'fields': ('last_login', 'date_joined')
                 })
             )
-    list_display = ('username', 'get_full_name', 'email')
+    list_display = ('username', 'get_full_name', 'email', 'bill_count',
+            'total_billed', 'total_unpaid', 'last_billing_date')
     actions = ['export_email']
     form = UserForm
 
-    def export_email(self, request, queryset):
-        """ Export emails of selected account """
-        response = HttpResponse(content_type='text/csv')
+    def get_queryset(self, request):
+        """ Join billing summary, totals are not computed from bills """
+        return super(UserAdmin, self).get_queryset(request) \
+                .select_related('billing_summary')
+
+    def billing_summary(self, obj):
+        try:
+            return obj.billing_summary
+        except ObjectDoesNotExist:
+            # user has never been billed
+            return UserBillingSummary(user=obj)
 
-        writer = csv.writer(response)
-        for email in queryset.values_list('email'):
-            writer.writerow(email)
+    def bill_count(self, obj):
+        return self.billing_summary(obj).bill_count
+    bill_count.short_description = _('Bills')
+    bill_count.admin_order_field = 'billing_summary__bill_count'
 
+    def total_billed(self, obj):
+        return self.billing_summary(obj).total_billed
+    total_billed.short_description = _('Total billed')
+    total_billed.admin_order_field = 'billing_summary__total_billed'
+
+    def total_unpaid(self, obj):
+        return self.billing_summary(obj).total_unpaid
+    total_unpaid.short_description = _('Outstanding balance')
+    total_unpaid.admin_order_field = 'billing_summary__total_unpaid'
+
+    def last_billing_date(self, obj):
+        return self.billing_summary(obj).last_billing_date
+    last_billing_date.short_description = _('Last bill date')
+    last_billing_date.admin_order_field = 'billing_summary__last_billing_date'
+
+    def export_email(self, request, queryset):
+        """ Export emails of selected account """
+        response = StreamingHttpResponse(emails_csv(queryset),
+                content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="emails.csv"'
         return response
     export_email.short_description = _('Export email of selected users')
 
@@ -135,8 +274,17 @@ class ServiceAdmin(admin.ModelAdmin):
     list_editable = ('is_available',)
     list_filter = ('is_available',)
 
+class SubscriptionAdmin(admin.ModelAdmin):
+    model = Subscription
+    list_display = ('user', 'service', 'quantity', 'is_active')
+    list_editable = ('is_active',)
+    list_filter = ('is_active', 'service')
+    list_select_related = ('user', 'service')
+    search_fields = ('user__first_name', 'user__last_name', 'user__username')
+
 admin.site.register(Bill, BillAdmin)
 admin.site.register(Service, ServiceAdmin)
+admin.site.register(Subscription, SubscriptionAdmin)
 
 # User have to be unregistered
 admin.site.unregister(User)
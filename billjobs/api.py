@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from django.db import connections
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import quote_etag
+from rest_framework import generics
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from .models import Bill
+from .permissions import CustomBillAPIPermission
+from .serializers import BillSerializer
+from collections import OrderedDict
+import binascii
+import hashlib
+
+
+class BillKeysetPagination(BasePagination):
+    """ Paginate bills by (billing_date, id), without OFFSET
+
+    The cursor holds date and id of the last bill of the page, the next page
+    starts right after it. Each page costs an index range scan whatever its
+    position, and a bill created during a crawl is never seen twice.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def encode_cursor(self, bill):
+        position = '{}|{}'.format(bill.billing_date.isoformat(), bill.id)
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            billing_date, bill_id = urlsafe_b64decode(cursor.encode()) \
+                    .decode().split('|')
+            billing_date = parse_date(billing_date)
+            bill_id = int(bill_id)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            billing_date = None
+        if billing_date is None:
+            raise NotFound('Invalid cursor')
+        return billing_date, bill_id
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or 100
+        return min(max(page_size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            # a row value comparison lets the database seek the position in
+            # the (billing_date, id) index
+            queryset = queryset.extra(
+                    where=['({}, {}) > (%s, %s)'.format(
+                        *self.ordering_columns(queryset))],
+                    params=self.decode_cursor(cursor))
+        bills = list(queryset.order_by('billing_date', 'id')[:page_size + 1])
+        self.next_bill = bills[page_size - 1] \
+                if len(bills) > page_size else None
+        return bills[:page_size]
+
+    def ordering_columns(self, queryset):
+        quote_name = connections[queryset.db].ops.quote_name
+        table = quote_name(queryset.model._meta.db_table)
+        return ('{}.{}'.format(table, quote_name('billing_date')),
+                '{}.{}'.format(table, quote_name('id')))
+
+    def get_next_link(self):
+        if self.next_bill is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                self.cursor_query_param, self.encode_cursor(self.next_bill))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+            ]))
+
+
+class ETagMixin(object):
+    """ Answer 304 Not Modified when client already has the content """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super(ETagMixin, self).finalize_response(
+                request, response, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD') \
+                or response.status_code != 200:
+            return response
+        response.render()
+        response['ETag'] = quote_etag(
+                hashlib.sha1(response.content).hexdigest())
+        return get_conditional_response(request, etag=response['ETag'],
+                response=response)
+
+
+class BillAPI(ETagMixin, generics.ListAPIView):
+    """
+    API endpoint listing bills with their lines, ordered by date then id
+
+    * Follow next link to read every bill, a page is cheap at any position
+    """
+    serializer_class = BillSerializer
+    pagination_class = BillKeysetPagination
+    permission_classes = (CustomBillAPIPermission,)
+
+    def get_queryset(self):
+        queryset = BillSerializer.setup_queryset(Bill.objects.all())
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(user=self.request.user)
+        return queryset
+
+
+class BillDetailAPI(ETagMixin, generics.RetrieveAPIView):
+    """
+    API endpoint that allow admin and user to read a bill with its lines
+
+    * admin can read all bills
+    * user can read his bills
+    """
+    serializer_class = BillSerializer
+    permission_classes = (CustomBillAPIPermission,)
+    queryset = BillSerializer.setup_queryset(Bill.objects.all())
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from django.db import connection, transaction, IntegrityError
+from django.db.models.expressions import RawSQL
+from .models import Bill, BillLine, BillingRun, PdfRenderJob, Subscription, \
+        rebuild_billing_summaries, reopen_period
+from .cache import invalidate_reports
+from .settings import BILLJOBS_PDF_PRERENDER
+from collections import OrderedDict
+import datetime
+
+
+def period_billing_date(period):
+    """ Return date of bills of a YYYY-MM period
+
+    Bills of the current month are dated today, bills of another month on
+    its first day.
+    """
+    today = datetime.date.today()
+    if today.strftime('%Y-%m') == period:
+        return today
+    return datetime.datetime.strptime(period, '%Y-%m').date()
+
+
+def generate_bills(period, batch_size=1000):
+    """ Create a bill of active subscriptions of each user for a period
+
+    Bills and lines of batch_size users are inserted with a few queries,
+    without saving each instance and running its signals. Bills are dated
+    and numbered in the period. Bills of a period are created once, return
+    None when they already exist.
+    """
+    try:
+        with transaction.atomic():
+            run = BillingRun.objects.create(period=period)
+            subscriptions = Subscription.objects \
+                    .filter(is_active=True, user__is_active=True)
+            user_ids = list(subscriptions.order_by('user_id')
+                    .values_list('user_id', flat=True).distinct())
+            for i in range(0, len(user_ids), batch_size):
+                create_bills(subscriptions.filter(
+                    user_id__in=user_ids[i:i+batch_size]), period)
+            run.bill_count = len(user_ids)
+            run.save()
+    except IntegrityError:
+        if BillingRun.objects.filter(period=period).exists():
+            return None
+        raise
+    return run
+
+
+def create_bills(subscriptions, period):
+    """ Create one bill per user of subscriptions and return their ids """
+    rows = list(subscriptions.order_by('user_id', 'pk').values_list(
+        'user_id', 'service_id', 'service__reference', 'service__name',
+        'service__description', 'service__price', 'quantity'))
+
+    lines = OrderedDict()
+    for user_id, *line in rows:
+        lines.setdefault(user_id, []).append(line)
+
+    bills = Bill.objects.bulk_create_for_users(lines,
+            billing_date=period_billing_date(period))
+    bill_ids = dict((bill.user_id, bill.pk) for bill in bills)
+
+    BillLine.objects.bulk_create(
+            BillLine(bill_id=bill_ids[user_id], service_id=service_id,
+                reference=reference, name=name, description=description,
+                unit_price=price, quantity=quantity, total=price * quantity,
+                note=period)
+            for user_id, user_lines in lines.items()
+            for service_id, reference, name, description, price, quantity
+            in user_lines)
+    # amount of each bill is the sum of its lines, computed by the database
+    quote_name = connection.ops.quote_name
+    Bill.objects.filter(pk__in=bill_ids.values()).update(amount=RawSQL(
+        'SELECT COALESCE(SUM(total), 0) FROM {} WHERE bill_id = {}.id'.format(
+            quote_name(BillLine._meta.db_table),
+            quote_name(Bill._meta.db_table)), ()))
+
+    rebuild_billing_summaries(list(bill_ids))
+    for billing_date in set(bill.billing_date for bill in bills):
+        reopen_period(billing_date)
+        invalidate_reports(billing_date)
+    if BILLJOBS_PDF_PRERENDER:
+        PdfRenderJob.objects.bulk_create(
+                PdfRenderJob(bill_id=bill_id) for bill_id in bill_ids.values())
+    return list(bill_ids.values())
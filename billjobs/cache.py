@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+from django.core.cache import cache as default_cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from .pdf import render_invoice
+from .render import get_render_pool, render_in_pool
+from .settings import BILLJOBS_PDF_CACHE, BILLJOBS_PDF_CACHE_TIMEOUT, \
+        BILLJOBS_PDF_RENDER_TIMEOUT, BILLJOBS_FORCE_USER_GROUP, \
+        BILLJOBS_DEBUG_PDF, BILLJOBS_BILL_LOGO_PATH, \
+        BILLJOBS_BILL_LOGO_WIDTH, BILLJOBS_BILL_LOGO_HEIGHT, \
+        BILLJOBS_BILL_PAYMENT_INFO
+from .settings import BILLJOBS_REPORTS_CACHE
+import datetime
+import hashlib
+import time
+
+PDF_KEY = 'billjobs:pdf:{}'
+BILL_PDF_KEY = 'billjobs:pdf:bill:{}'
+FORCE_USER_GROUP_KEY = 'billjobs:groups:force'
+REPORT_KEY = 'billjobs:reports:{}:{}'
+# reports computed for a month, unpaid aging is computed for a day
+PERIOD_REPORTS = ('month', 'service', 'coworker')
+
+
+def is_shared_cache(cache):
+    ''' Return False for backends only seen by the current process '''
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def get_pdf_cache():
+    ''' Return the cache backend used to store pdf, None if disabled '''
+    if BILLJOBS_PDF_CACHE is None:
+        return None
+    return caches[BILLJOBS_PDF_CACHE]
+
+
+def invoice_fingerprint(invoice):
+    ''' Return a hash of everything rendered in an invoice snapshot
+
+    Any change on the bill, its lines, the services or the pdf settings gives
+    a new fingerprint, so a cached pdf can never be stale.
+    '''
+    data = (
+            invoice,
+            BILLJOBS_DEBUG_PDF, BILLJOBS_BILL_LOGO_PATH,
+            BILLJOBS_BILL_LOGO_WIDTH, BILLJOBS_BILL_LOGO_HEIGHT,
+            BILLJOBS_BILL_PAYMENT_INFO
+            )
+    return hashlib.sha1(repr(data).encode('utf-8')).hexdigest()
+
+
+def get_cached_pdf(fingerprint):
+    ''' Return (content, last_modified) stored for a fingerprint or None '''
+    cache = get_pdf_cache()
+    if cache is None:
+        return None
+    return cache.get(PDF_KEY.format(fingerprint))
+
+
+def set_cached_pdf(invoice, fingerprint, content):
+    ''' Store the pdf content of an invoice and return its timestamp '''
+    last_modified = int(time.time())
+    cache = get_pdf_cache()
+    if cache is not None:
+        cache.set_many({
+            PDF_KEY.format(fingerprint): (content, last_modified),
+            BILL_PDF_KEY.format(invoice.bill_id): fingerprint,
+            }, BILLJOBS_PDF_CACHE_TIMEOUT)
+    return last_modified
+
+
+def get_invoice_pdf(invoice, fingerprint=None):
+    ''' Return pdf content, fingerprint and last modification timestamp
+
+    The pdf is only rendered when no entry matches the invoice fingerprint,
+    computed unless given. Cache eviction is left to the cache backend
+    (MAX_ENTRIES, memory limit...).
+    With a render pool, raise PdfRenderBusy when it can not render the pdf
+    in time.
+    '''
+    if fingerprint is None:
+        fingerprint = invoice_fingerprint(invoice)
+    cached = get_cached_pdf(fingerprint)
+    if cached is not None:
+        content, last_modified = cached
+        return content, fingerprint, last_modified
+
+    if get_render_pool() is None:
+        content = render_invoice(invoice)
+    else:
+        # a pdf rendered too late is cached for the next download
+        content = render_in_pool(invoice, BILLJOBS_PDF_RENDER_TIMEOUT,
+                lambda content: set_cached_pdf(invoice, fingerprint, content))
+    last_modified = set_cached_pdf(invoice, fingerprint, content)
+    return content, fingerprint, last_modified
+
+
+def invalidate_bill_pdf(bill_id):
+    ''' Remove the cached pdf of a bill '''
+    cache = get_pdf_cache()
+    if cache is None:
+        return
+    key = BILL_PDF_KEY.format(bill_id)
+    fingerprint = cache.get(key)
+    if fingerprint is not None:
+        cache.delete_many([PDF_KEY.format(fingerprint), key])
+
+
+def get_force_user_group_id():
+    ''' Return id of BILLJOBS_FORCE_USER_GROUP, None if not set
+
+    Group post_save and post_delete signals invalidate the id in the process
+    changing the group, register_user reads it again when it is stale in
+    another one. Raise Group.DoesNotExist when no group has this name.
+    '''
+    if BILLJOBS_FORCE_USER_GROUP is None:
+        return None
+    group_id = default_cache.get(FORCE_USER_GROUP_KEY)
+    if group_id is None:
+        from django.contrib.auth.models import Group
+        group_id = Group.objects.values_list('id', flat=True).get(
+                name=BILLJOBS_FORCE_USER_GROUP)
+        default_cache.set(FORCE_USER_GROUP_KEY, group_id, None)
+    return group_id
+
+
+def invalidate_force_user_group():
+    ''' Remove the id of the group forced on new users '''
+    default_cache.delete(FORCE_USER_GROUP_KEY)
+
+
+def get_reports_cache():
+    ''' Return the cache backend used to store reports '''
+    return caches[BILLJOBS_REPORTS_CACHE]
+
+
+def invalidate_reports(billing_date):
+    ''' Remove cached reports of the month of a bill and unpaid aging '''
+    period = billing_date.strftime('%Y-%m')
+    get_reports_cache().delete_many(
+            [REPORT_KEY.format(name, period) for name in PERIOD_REPORTS]
+            + [REPORT_KEY.format('aging', datetime.date.today().isoformat())])
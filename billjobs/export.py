@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+from django.utils.translation import ugettext as _
+from .cache import get_cached_pdf, invoice_fingerprint, set_cached_pdf
+from .invoice import Invoice
+from .models import Bill, BillLine
+from .pdf import render_invoice
+import csv
+import zipfile
+
+
+class ZipStreamBuffer(object):
+    """ Unseekable file object keeping what zipfile writes until it is read """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self):
+        """ Return written bytes and forget them """
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_bills_pdf(queryset, executor=None, chunk_size=50):
+    """ Yield (invoice, pdf content) for each bill of queryset
+
+    Bills are loaded chunk by chunk as invoice snapshots, so rendering does
+    not hit the database and only one chunk of bills is in memory. With an
+    executor, pdf missing in cache are rendered by its pool of worker
+    processes. Each pdf is yielded once rendered, without waiting for the
+    rest of its chunk.
+    """
+    bill_ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(bill_ids), chunk_size):
+        invoices = [Invoice.from_bill(bill) for bill in Invoice.prefetch(
+            Bill.objects.filter(id__in=bill_ids[i:i+chunk_size]))
+            .order_by('id')]
+        entries = []
+        for invoice in invoices:
+            fingerprint = invoice_fingerprint(invoice)
+            cached = get_cached_pdf(fingerprint)
+            entries.append((invoice, fingerprint,
+                None if cached is None else cached[0]))
+
+        # rendered lazily in bill order, each pdf is cached and yielded as
+        # soon as it is produced
+        missing = [invoice for invoice, f, content in entries
+                if content is None]
+        if executor is not None:
+            rendered = executor.map(render_invoice, missing)
+        else:
+            rendered = (render_invoice(invoice) for invoice in missing)
+        for invoice, fingerprint, content in entries:
+            if content is None:
+                content = next(rendered)
+                set_cached_pdf(invoice, fingerprint, content)
+            yield invoice, content
+
+
+def bills_pdf_zip(queryset, processes=0, chunk_size=50):
+    """ Yield a zip archive of the invoices of queryset piece by piece
+
+    Each pdf is written in the archive and sent as soon as it is produced.
+    """
+    buffer = ZipStreamBuffer()
+    executor = ProcessPoolExecutor(processes) if processes else None
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for invoice, content in iter_bills_pdf(
+                    queryset, executor, chunk_size):
+                archive.writestr('{}.pdf'.format(invoice.number), content)
+                yield buffer.read()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    # central directory is written when archive is closed
+    yield buffer.read()
+
+
+class Echo(object):
+    """ File object returning what csv writer writes instead of keeping it """
+
+    def write(self, value):
+        return value
+
+
+def iter_chunks(queryset, fields, chunk_size=2000):
+    """ Yield lists of (pk, *fields) rows of queryset, ordered by pk
+
+    Each list is read by its own query starting after the last primary key of
+    the previous one, so no more than chunk_size rows are in memory and no
+    cursor stays open between two chunks, whatever the database.
+    """
+    queryset = queryset.order_by('pk').values_list('pk', *fields)
+    rows = list(queryset[:chunk_size])
+    while rows:
+        yield rows
+        if len(rows) < chunk_size:
+            break
+        rows = list(queryset.filter(pk__gt=rows[-1][0])[:chunk_size])
+
+
+def csv_chunks(chunks):
+    """ Yield csv text of each list of rows """
+    writer = csv.writer(Echo())
+    for rows in chunks:
+        yield ''.join(writer.writerow(row) for row in rows)
+
+
+def emails_csv(queryset, chunk_size=2000):
+    """ Yield a csv file of emails of users in queryset piece by piece """
+    return csv_chunks(
+            [(email,) for pk, email in rows]
+            for rows in iter_chunks(queryset, ('email',), chunk_size))
+
+
+def iter_ledger_rows(queryset, chunk_size=500):
+    """ Yield lists of ledger rows, one row per line of bills in queryset
+
+    Bills are read chunk by chunk, then lines of a chunk in a single query.
+    """
+    header = (_('Bill number'), _('Date'), _('Coworker'),
+            _('Bill total amount'), _('Bill is paid ?'), _('Reference'),
+            _('Name'), _('Quantity'), _('Total'), _('Note'))
+    yield [header]
+    for bills in iter_chunks(queryset, (), chunk_size):
+        lines = BillLine.objects \
+                .filter(bill_id__in=[pk for pk, in bills]) \
+                .order_by('bill_id', 'pk') \
+                .values_list('bill__number', 'bill__billing_date',
+                        'bill__user__first_name', 'bill__user__last_name',
+                        'bill__amount', 'bill__isPaid', 'reference', 'name',
+                        'quantity', 'total', 'note')
+        yield [(number, billing_date, '{} {}'.format(first_name, last_name))
+                + tuple(line)
+                for number, billing_date, first_name, last_name, *line
+                in lines]
+
+
+def ledger_csv(queryset, chunk_size=500):
+    """ Yield the accounting ledger of bills in queryset as csv piece by piece
+    """
+    return csv_chunks(iter_ledger_rows(queryset, chunk_size))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from django.db.models import Prefetch
+
+
+class InvoiceLine(namedtuple('InvoiceLine', ('reference', 'name',
+        'description', 'note', 'price', 'quantity', 'total'))):
+    """ Bill line as printed on the invoice """
+    __slots__ = ()
+
+
+class Invoice(namedtuple('Invoice', ('bill_id', 'number', 'billing_date',
+        'issuer_address', 'customer_name', 'billing_address', 'amount',
+        'lines'))):
+    """ Immutable snapshot of what the invoice of a bill shows
+
+    It only holds plain values, so it is rendered without the database,
+    pickled cheaply to rendering processes and hashed for the pdf cache.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def prefetch(queryset):
+        """ Load users and lines of bills with two queries """
+        # avoid circular import, models import the pdf cache
+        from .models import BillLine
+        return queryset.select_related('user').prefetch_related(Prefetch(
+            'billline_set', queryset=BillLine.objects.order_by('id')))
+
+    @classmethod
+    def from_bill(cls, bill):
+        """ Return snapshot of a bill, prefetch its lines """
+        return cls(
+                bill_id=bill.id,
+                number=bill.number,
+                billing_date=bill.billing_date,
+                issuer_address=bill.issuer_address,
+                customer_name='{} {}'.format(
+                    bill.user.first_name, bill.user.last_name),
+                billing_address=bill.billing_address,
+                amount=bill.amount,
+                lines=tuple(InvoiceLine(
+                    reference=line.reference,
+                    name=line.name,
+                    description=line.description,
+                    note=line.note,
+                    price=line.unit_price,
+                    quantity=line.quantity,
+                    total=line.total)
+                    for line in bill.billline_set.all()))
+
+    @classmethod
+    def load(cls, bill_id):
+        """ Return snapshot of a bill read with two queries """
+        from .models import Bill
+        return cls.from_bill(cls.prefetch(Bill.objects.all()).get(pk=bill_id))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from billjobs.reports import close_period, is_closed, parse_period
+import datetime
+
+
+class Command(BaseCommand):
+    help = 'Write rollups of a closed month read by reports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Closed month, as YYYY-MM, '
+                'default is the previous month')
+
+    def handle(self, *args, **options):
+        last_month = datetime.date.today().replace(day=1) \
+                - datetime.timedelta(days=1)
+        try:
+            period = parse_period(options['period']
+                    or last_month.strftime('%Y-%m')).strftime('%Y-%m')
+        except ValueError:
+            raise CommandError('Period must be formatted as YYYY-MM')
+        if not is_closed(period):
+            raise CommandError('Only months before the current one can be '
+                    'closed')
+
+        closed = close_period(period)
+        if closed is None:
+            self.stdout.write('{} was already closed'.format(period))
+        else:
+            self.stdout.write('Closed {} with {} bills'.format(
+                period, closed.bill_count))
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from billjobs.billing import generate_bills
+import datetime
+
+
+class Command(BaseCommand):
+    help = 'Create bills of active subscriptions for a month'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', required=True,
+                help='Billed month, as YYYY-MM')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                help='Number of users billed by each batch of queries')
+
+    def handle(self, *args, **options):
+        try:
+            period = datetime.datetime.strptime(options['period'], '%Y-%m') \
+                    .strftime('%Y-%m')
+        except ValueError:
+            raise CommandError('Period must be formatted as YYYY-MM')
+
+        run = generate_bills(period, options['batch_size'])
+        if run is None:
+            self.stdout.write(
+                    'Bills of {} were already generated'.format(period))
+        else:
+            self.stdout.write('Created {} bills for {}'.format(
+                run.bill_count, period))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from billjobs.cache import get_reports_cache, is_shared_cache
+from billjobs.reports import parse_period, precompute_reports
+import datetime
+
+
+class Command(BaseCommand):
+    help = 'Compute and cache reports of closed months'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--first', help='First month, as YYYY-MM, '
+                'default is the same month five years ago')
+        parser.add_argument('--last', help='Last month, as YYYY-MM, '
+                'default is the previous month')
+
+    def handle(self, *args, **options):
+        if not is_shared_cache(get_reports_cache()):
+            raise CommandError('BILLJOBS_REPORTS_CACHE must be shared by '
+                    'every process, like memcached or redis: reports '
+                    'computed here would be lost')
+        today = datetime.date.today()
+        last_month = today.replace(day=1) - datetime.timedelta(days=1)
+        first = options['first'] or '{}-{:02d}'.format(
+                today.year - 5, today.month)
+        last = options['last'] or last_month.strftime('%Y-%m')
+        try:
+            parse_period(first)
+            parse_period(last)
+        except ValueError:
+            raise CommandError('Periods must be formatted as YYYY-MM')
+
+        count = precompute_reports(first, last)
+        self.stdout.write('Computed reports of {} closed months'.format(count))
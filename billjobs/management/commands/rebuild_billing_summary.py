@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from billjobs.export import iter_chunks
+from billjobs.models import rebuild_billing_summaries
+
+
+class Command(BaseCommand):
+    help = 'Compute billing summary of every user from their bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                help='Number of users summarized by each query')
+
+    def handle(self, *args, **options):
+        count = 0
+        for users in iter_chunks(User.objects.all(), (),
+                options['batch_size']):
+            rebuild_billing_summaries([pk for pk, in users])
+            count += len(users)
+        self.stdout.write('Rebuilt billing summary of {} users'.format(count))
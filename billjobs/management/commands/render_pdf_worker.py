@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from billjobs.cache import get_pdf_cache, is_shared_cache
+from billjobs.export import iter_bills_pdf
+from billjobs.models import Bill, PdfRenderJob
+from billjobs.settings import BILLJOBS_PDF_PRERENDER_PROCESSES
+import time
+
+
+class Command(BaseCommand):
+    help = 'Render pdf of changed bills in the pdf cache ahead of download'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int,
+                default=BILLJOBS_PDF_PRERENDER_PROCESSES,
+                help='Number of rendering processes, 0 renders in this one')
+        parser.add_argument('--batch-size', type=int, default=10,
+                help='Number of jobs claimed at once')
+        parser.add_argument('--max-attempts', type=int, default=3,
+                help='Number of renderings of a bill before giving up')
+        parser.add_argument('--sleep', type=float, default=5,
+                help='Seconds to wait when queue is empty')
+        parser.add_argument('--once', action='store_true',
+                help='Stop when queue is empty')
+
+    def handle(self, *args, **options):
+        cache = get_pdf_cache()
+        if cache is None:
+            raise CommandError('BILLJOBS_PDF_CACHE is disabled, '
+                    'rendered pdf would be lost')
+        if not is_shared_cache(cache):
+            raise CommandError('BILLJOBS_PDF_CACHE must be shared by every '
+                    'process, like memcached or redis: pdf rendered here '
+                    'would be lost')
+
+        processes = options['processes']
+        executor = ProcessPoolExecutor(processes) if processes else None
+        try:
+            while True:
+                jobs = PdfRenderJob.objects.claim(options['batch_size'],
+                        max_attempts=options['max_attempts'])
+                if jobs:
+                    self.render(jobs, executor)
+                    continue
+                for bill_id in PdfRenderJob.objects.drop_abandoned(
+                        options['max_attempts']):
+                    self.stderr.write('Gave up rendering bill {}'.format(
+                        bill_id))
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def render(self, jobs, executor):
+        """ Render pdf of claimed jobs and remove them from the queue
+
+        A failed job stays locked, it is claimed again once its lock is over.
+        """
+        failed = set()
+        try:
+            for invoice, content in iter_bills_pdf(Bill.objects.filter(
+                    pk__in=[job.bill_id for job in jobs]), executor):
+                pass
+        except Exception:
+            # render bills one by one to find the failing ones, those
+            # rendered before the error are read from the pdf cache
+            for job in jobs:
+                try:
+                    for invoice, content in iter_bills_pdf(
+                            Bill.objects.filter(pk=job.bill_id)):
+                        pass
+                except Exception as error:
+                    failed.add(job.bill_id)
+                    self.stderr.write('Failed to render bill {}: {!r}'
+                            .format(job.bill_id, error))
+        for job in jobs:
+            if job.bill_id not in failed:
+                PdfRenderJob.objects.complete(job)
+        self.stdout.write('Rendered {} invoices'.format(
+            len(jobs) - len(failed)))
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from django.utils.deprecation import MiddlewareMixin
+from .settings import BILLJOBS_METRICS_SAMPLE_RATE
+import json
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger('billjobs.metrics')
+
+# name, type and help of each metric, by field of RequestStats
+METRICS = (
+        ('requests', 'billjobs_requests_total', 'counter',
+            'Sampled requests'),
+        ('queries', 'billjobs_sql_queries_total', 'counter',
+            'SQL queries of sampled requests'),
+        ('sql_seconds', 'billjobs_sql_seconds_total', 'counter',
+            'Time spent in SQL queries by sampled requests'),
+        ('pdf_seconds', 'billjobs_pdf_render_seconds_total', 'counter',
+            'Time spent rendering pdf by sampled requests'),
+        ('seconds', 'billjobs_request_seconds_total', 'counter',
+            'Time spent answering sampled requests'),
+        ('response_bytes', 'billjobs_response_bytes_total', 'counter',
+            'Size of responses to sampled requests'),
+        )
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    """ Costs measured while answering one request """
+
+    def __init__(self, view):
+        self.view = view
+        self.status = None
+        self.requests = 1
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.pdf_seconds = 0.0
+        self.seconds = 0.0
+        self.response_bytes = 0
+
+    @contextmanager
+    def active(self):
+        """ Measure queries and pdf rendering of the block """
+        start = time.perf_counter()
+        _local.stats = self
+        for connection in connections.all():
+            # only cursors created during the block are counted
+            connection.make_cursor = \
+                    lambda cursor, db=connection: StatsCursorWrapper(
+                            cursor, db, self)
+            # DEBUG cursors keep logging queries
+            connection.make_debug_cursor = \
+                    lambda cursor, db=connection: StatsCursorWrapper(
+                            type(db).make_debug_cursor(db, cursor), db, self)
+        try:
+            yield
+        finally:
+            for connection in connections.all():
+                connection.__dict__.pop('make_cursor', None)
+                connection.__dict__.pop('make_debug_cursor', None)
+            _local.stats = None
+            self.seconds += time.perf_counter() - start
+
+    def as_dict(self):
+        return dict(view=self.view, status=self.status,
+                queries=self.queries, sql_ms=round(self.sql_seconds * 1000, 3),
+                pdf_ms=round(self.pdf_seconds * 1000, 3),
+                duration_ms=round(self.seconds * 1000, 3),
+                response_bytes=self.response_bytes)
+
+
+class StatsCursorWrapper(CursorWrapper):
+    """ Cursor counting queries and their time, without keeping their SQL """
+
+    def __init__(self, cursor, db, stats):
+        super(StatsCursorWrapper, self).__init__(cursor, db)
+        self.stats = stats
+
+    @contextmanager
+    def measure(self, count):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stats.sql_seconds += time.perf_counter() - start
+            self.stats.queries += count
+
+    def execute(self, sql, params=None):
+        with self.measure(1):
+            return super(StatsCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        with self.measure(1):
+            return super(StatsCursorWrapper, self).executemany(
+                    sql, param_list)
+
+    def callproc(self, procname, params=None):
+        with self.measure(1):
+            return super(StatsCursorWrapper, self).callproc(procname, params)
+
+
+@contextmanager
+def measure_pdf_render():
+    """ Add time of the block to pdf time of the measured request """
+    stats = getattr(_local, 'stats', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.pdf_seconds += time.perf_counter() - start
+
+
+class MetricsRegistry(object):
+    """ Totals of sampled requests of this process, by view
+
+    Counters and gauges of the process, like the pdf render queue, are
+    exported with them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def add(self, stats):
+        with self._lock:
+            totals = self._totals.setdefault(
+                    stats.view, dict.fromkeys(m[0] for m in METRICS))
+            for field, name, kind, description in METRICS:
+                totals[field] = (totals[field] or 0) + getattr(stats, field)
+
+    def increment(self, name, description, value=1):
+        """ Add value to a counter of the process """
+        with self._lock:
+            total = self._counters.get(name, (description, 0))[1]
+            self._counters[name] = (description, total + value)
+
+    def add_gauge(self, name, description, read):
+        """ Export value returned by read() each time metrics are read """
+        with self._lock:
+            self._gauges[name] = (description, read)
+
+    def clear(self):
+        with self._lock:
+            self._totals = {}
+            self._counters = {}
+
+    def as_prometheus(self):
+        """ Return totals in Prometheus text exposition format """
+        with self._lock:
+            totals = sorted(self._totals.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        lines = []
+        for field, name, kind, description in METRICS:
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for view, values in totals:
+                lines.append('{}{{view="{}"}} {}'.format(
+                    name, view.replace('\\', '\\\\').replace('"', '\\"'),
+                    values[field]))
+        for name, (description, value) in counters:
+            lines.extend(('# HELP {} {}'.format(name, description),
+                '# TYPE {} counter'.format(name), '{} {}'.format(name, value)))
+        for name, (description, read) in gauges:
+            lines.extend(('# HELP {} {}'.format(name, description),
+                '# TYPE {} gauge'.format(name), '{} {}'.format(name, read())))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def record(stats):
+    """ Add stats of a request to totals and log them """
+    registry.add(stats)
+    logger.info(json.dumps(stats.as_dict(), sort_keys=True),
+            extra={'metrics': stats.as_dict()})
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """ Measure queries, pdf rendering and response size of requests
+
+    A request is measured with probability BILLJOBS_METRICS_SAMPLE_RATE.
+    Streamed responses are measured until their last chunk is sent.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if random.random() >= BILLJOBS_METRICS_SAMPLE_RATE:
+            return None
+        match = request.resolver_match
+        stats = RequestStats(
+                match.view_name if match else view_func.__name__)
+        # the view runs after this method, measure until its response
+        request.billjobs_stats = stats
+        request.billjobs_measure = stats.active()
+        request.billjobs_measure.__enter__()
+        return None
+
+    def stop(self, request):
+        """ Stop measuring the view, return stats of the request """
+        measure = request.__dict__.pop('billjobs_measure', None)
+        if measure is not None:
+            measure.__exit__(None, None, None)
+        return request.__dict__.pop('billjobs_stats', None)
+
+    def process_exception(self, request, exception):
+        stats = self.stop(request)
+        if stats is not None:
+            stats.status = 500
+            record(stats)
+        return None
+
+    def process_response(self, request, response):
+        stats = self.stop(request)
+        if stats is None:
+            return response
+        stats.status = response.status_code
+        if response.streaming:
+            response.streaming_content = self.stream(
+                    stats, response.streaming_content)
+        else:
+            stats.response_bytes = len(response.content)
+            record(stats)
+        return response
+
+    def stream(self, stats, content):
+        """ Measure production of each chunk and record stats at the end """
+        content = iter(content)
+        try:
+            while True:
+                with stats.active():
+                    try:
+                        chunk = next(content)
+                    except StopIteration:
+                        return
+                stats.response_bytes += len(chunk)
+                yield chunk
+        finally:
+            record(stats)
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 19:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+def init_bill_number_sequences(apps, schema_editor):
+    ''' Data migration start each month sequence after the highest bill number
+    already given in this month
+    '''
+    Bill = apps.get_model('billjobs', 'Bill')
+    BillNumberSequence = apps.get_model('billjobs', 'BillNumberSequence')
+    last_values = {}
+    for number in Bill.objects.values_list('number', flat=True).iterator():
+        period, value = number[1:7], number[7:]
+        if not (number.startswith('F') and period.isdigit() and
+                value.isdigit()):
+            continue
+        last_values[period] = max(last_values.get(period, 0), int(value))
+    BillNumberSequence.objects.bulk_create(
+            BillNumberSequence(period=period, last_value=value)
+            for period, value in last_values.items())
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billjobs', '0007_change_service_description_field_max_len'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillNumberSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=6, unique=True)),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Bill number sequence',
+            },
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='number',
+            field=models.CharField(blank=True, help_text='This value is set automatically.', max_length=16, unique=True, verbose_name='Bill number'),
+        ),
+        migrations.RunPython(init_bill_number_sequences,
+            migrations.RunPython.noop),
+    ]
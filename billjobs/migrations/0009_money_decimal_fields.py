@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+from django.db.models import Func, Value
+from django.db.models.functions import Cast
+
+# rows converted by each UPDATE
+BATCH_SIZE = 10000
+
+MONEY_FIELDS = (
+        ('Bill', 'amount', 12),
+        ('Service', 'price', 10),
+        ('BillLine', 'total', 12),
+        )
+
+def copy_money_to_decimal(apps, schema_editor):
+    ''' Data migration copy float money columns in their decimal column
+
+    Rows are converted by ranges of primary keys, one UPDATE and one
+    transaction per batch, so large tables are not locked for the whole
+    migration and no row is loaded in python.
+    '''
+    db_alias = schema_editor.connection.alias
+    for model_name, field_name, max_digits in MONEY_FIELDS:
+        model = apps.get_model('billjobs', model_name)
+        queryset = model.objects.using(db_alias)
+        bounds = queryset.aggregate(
+                first=models.Min('pk'), last=models.Max('pk'))
+        if bounds['first'] is None:
+            continue
+        decimal_field = models.DecimalField(
+                max_digits=max_digits, decimal_places=2)
+        # SQLite keeps the float in a decimal column, round it explicitly
+        decimal_value = Func(Cast(field_name, decimal_field), Value(2),
+                function='ROUND', output_field=decimal_field)
+        for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+            with transaction.atomic(using=db_alias):
+                queryset.filter(pk__gte=start, pk__lt=start + BATCH_SIZE) \
+                        .update(**{field_name + '_decimal': decimal_value})
+
+class Migration(migrations.Migration):
+
+    # each batch of the data migration is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('billjobs', '0008_bill_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='amount_decimal',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='price_decimal',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='billline',
+            name='total_decimal',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.RunPython(copy_money_to_decimal, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='bill',
+            name='amount',
+        ),
+        migrations.RemoveField(
+            model_name='service',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='billline',
+            name='total',
+        ),
+        migrations.RenameField(
+            model_name='bill',
+            old_name='amount_decimal',
+            new_name='amount',
+        ),
+        migrations.RenameField(
+            model_name='service',
+            old_name='price_decimal',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name='billline',
+            old_name='total_decimal',
+            new_name='total',
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='amount',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, help_text='The amount is computed automatically.', max_digits=12, verbose_name='Bill total amount'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='price',
+            field=models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Price'),
+        ),
+        migrations.AlterField(
+            model_name='billline',
+            name='total',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='This value is computed automatically', max_digits=12, verbose_name='Total'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:30
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# BillAdmin.search_fields use icontains lookups, PostgreSQL runs them as
+# UPPER("column"::text) LIKE UPPER('%term%'). Only a trigram index on this
+# exact expression avoids a sequential scan.
+SEARCH_INDEXES = (
+        ('billjobs_user_first_name_trgm', 'auth_user', 'first_name'),
+        ('billjobs_user_last_name_trgm', 'auth_user', 'last_name'),
+        ('billjobs_bill_number_trgm', 'billjobs_bill', 'number'),
+        ('billjobs_bill_amount_trgm', 'billjobs_bill', 'amount'),
+        )
+
+def has_trigram_extension(schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+def create_search_indexes(apps, schema_editor):
+    ''' Create trigram indexes when pg_trgm extension is installed
+
+    Other databases, or PostgreSQL without pg_trgm, keep scanning bills.
+    '''
+    if not has_trigram_extension(schema_editor):
+        return
+    for name, table, column in SEARCH_INDEXES:
+        schema_editor.execute(
+                'CREATE INDEX IF NOT EXISTS {} ON {} USING gin '
+                '((UPPER({}::text)) gin_trgm_ops)'.format(
+                    schema_editor.quote_name(name),
+                    schema_editor.quote_name(table),
+                    schema_editor.quote_name(column)))
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+            schema_editor.quote_name(name)))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('billjobs', '0009_money_decimal_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:00
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# users summarized by each query
+BATCH_SIZE = 1000
+
+def fill_billing_summaries(apps, schema_editor):
+    ''' Data migration compute billing summary of users having bills '''
+    db_alias = schema_editor.connection.alias
+    Bill = apps.get_model('billjobs', 'Bill')
+    UserBillingSummary = apps.get_model('billjobs', 'UserBillingSummary')
+    user_ids = list(Bill.objects.using(db_alias).order_by('user_id')
+            .values_list('user_id', flat=True).distinct())
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        totals = Bill.objects.using(db_alias) \
+                .filter(user_id__in=user_ids[start:start + BATCH_SIZE]) \
+                .order_by().values('user_id').annotate(
+                        bill_count=models.Count('id'),
+                        total_billed=models.Sum('amount'),
+                        total_unpaid=models.Sum(models.Case(
+                            models.When(isPaid=False, then='amount'),
+                            default=models.Value(0),
+                            output_field=models.DecimalField())),
+                        last_billing_date=models.Max('billing_date'))
+        UserBillingSummary.objects.using(db_alias).bulk_create(
+                UserBillingSummary(**total) for total in totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0008_alter_user_username_max_length'),
+        ('billjobs', '0011_pdf_render_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBillingSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='billing_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('bill_count', models.PositiveIntegerField(default=0, verbose_name='Bills')),
+                ('total_billed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total billed')),
+                ('total_unpaid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Outstanding balance')),
+                ('last_billing_date', models.DateField(blank=True, null=True, verbose_name='Last bill date')),
+            ],
+            options={
+                'verbose_name': 'User billing summary',
+                'verbose_name_plural': 'User billing summaries',
+            },
+        ),
+        migrations.RunPython(fill_billing_summaries,
+            migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:02
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billjobs', '0012_user_billing_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7, unique=True, verbose_name='Period')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bill_count', models.PositiveIntegerField(default=0, verbose_name='Bills')),
+            ],
+            options={
+                'verbose_name': 'Billing run',
+            },
+        ),
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.SmallIntegerField(default=1, verbose_name='Quantity')),
+                ('is_active', models.BooleanField(default=True, help_text='Uncheck this value to stop billing this service', verbose_name='Is active ?')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='billjobs.Service', verbose_name='Service')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Coworker')),
+            ],
+            options={
+                'verbose_name': 'Subscription',
+            },
+        ),
+    ]
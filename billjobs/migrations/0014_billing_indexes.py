@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:14
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+UNPAID_INDEX = 'billjobs_bill_unpaid'
+
+def create_unpaid_index(apps, schema_editor):
+    ''' Index unpaid bills only, where the database supports partial indexes
+
+    Paid bills are most of the table and never looked for by user, the index
+    stays small. MySQL has no partial index, the isPaid index is used.
+    '''
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    quote_name = schema_editor.quote_name
+    schema_editor.execute(
+            'CREATE INDEX {} ON {} ({}, {}) WHERE {} = {}'.format(
+                quote_name(UNPAID_INDEX),
+                quote_name('billjobs_bill'),
+                quote_name('user_id'),
+                quote_name('billing_date'),
+                quote_name('isPaid'),
+                schema_editor.quote_value(False)))
+
+def drop_unpaid_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+        schema_editor.quote_name(UNPAID_INDEX)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billjobs', '0013_subscription'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bill',
+            name='billing_date',
+            field=models.DateField(auto_now_add=True, db_index=True, help_text='This value is set automatically.', verbose_name='Date'),
+        ),
+        migrations.AlterField(
+            model_name='bill',
+            name='isPaid',
+            field=models.BooleanField(db_index=True, default=False, help_text='Check this value when bill is paid', verbose_name='Bill is paid ?'),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='is_available',
+            field=models.BooleanField(db_index=True, default=True, verbose_name='Is available ?'),
+        ),
+        migrations.AlterIndexTogether(
+            name='bill',
+            index_together=set([('user', 'billing_date')]),
+        ),
+        migrations.RunPython(create_unpaid_index, drop_unpaid_index),
+    ]
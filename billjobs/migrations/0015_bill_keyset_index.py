@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 20:15
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+def restore_unpaid_index(apps, schema_editor):
+    ''' SQLite rebuilds the bill table to alter a field and loses the
+    partial index of unpaid bills, Django does not know about it
+    '''
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    quote_name = schema_editor.quote_name
+    schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {} ON {} ({}, {}) WHERE {} = {}'.format(
+                quote_name('billjobs_bill_unpaid'),
+                quote_name('billjobs_bill'),
+                quote_name('user_id'),
+                quote_name('billing_date'),
+                quote_name('isPaid'),
+                schema_editor.quote_value(False)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billjobs', '0014_billing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_unpaid_index),
+        migrations.AlterField(
+            model_name='bill',
+            name='billing_date',
+            field=models.DateField(auto_now_add=True, help_text='This value is set automatically.', verbose_name='Date'),
+        ),
+        migrations.AlterIndexTogether(
+            name='bill',
+            index_together=set([('user', 'billing_date'), ('billing_date', 'id')]),
+        ),
+        migrations.RunPython(restore_unpaid_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 22:10
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+from django.db.models.expressions import RawSQL
+
+# bill lines updated by each transaction
+BATCH_SIZE = 5000
+
+def freeze_services(apps, schema_editor):
+    ''' Data migration copy service of each bill line, batch by batch '''
+    db_alias = schema_editor.connection.alias
+    quote_name = schema_editor.connection.ops.quote_name
+    BillLine = apps.get_model('billjobs', 'BillLine')
+    Service = apps.get_model('billjobs', 'Service')
+
+    def service_field(name):
+        return RawSQL('SELECT {} FROM {} WHERE {}.id = {}.service_id'.format(
+            quote_name(name), quote_name(Service._meta.db_table),
+            quote_name(Service._meta.db_table),
+            quote_name(BillLine._meta.db_table)), ())
+
+    lines = BillLine.objects.using(db_alias)
+    last_pk = lines.aggregate(last_pk=models.Max('pk'))['last_pk'] or 0
+    for start in range(0, last_pk + 1, BATCH_SIZE):
+        # a short transaction by batch, large tables are not locked for long
+        with transaction.atomic(using=db_alias):
+            lines.filter(pk__gte=start, pk__lt=start + BATCH_SIZE).update(
+                    reference=service_field('reference'),
+                    name=service_field('name'),
+                    description=service_field('description'),
+                    unit_price=service_field('price'))
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('billjobs', '0015_bill_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billline',
+            name='reference',
+            field=models.CharField(blank=True, default='', max_length=5, verbose_name='Reference'),
+        ),
+        migrations.AddField(
+            model_name='billline',
+            name='name',
+            field=models.CharField(blank=True, default='', max_length=128, verbose_name='Name'),
+        ),
+        migrations.AddField(
+            model_name='billline',
+            name='description',
+            field=models.CharField(blank=True, default='', max_length=256, verbose_name='Description'),
+        ),
+        migrations.AddField(
+            model_name='billline',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, default=0, help_text='This value is set automatically.', max_digits=10, verbose_name='Unit price'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(freeze_services, migrations.RunPython.noop),
+    ]
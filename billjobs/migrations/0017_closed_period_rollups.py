@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.7 on 2026-10-18 23:40
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('billjobs', '0016_billline_service_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClosedPeriod',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=7, unique=True, verbose_name='Period')),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('bill_count', models.PositiveIntegerField(default=0, verbose_name='Bills')),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total billed')),
+                ('unpaid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Outstanding balance')),
+            ],
+            options={
+                'verbose_name': 'Closed period',
+            },
+        ),
+        migrations.CreateModel(
+            name='CoworkerRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bill_count', models.PositiveIntegerField(default=0, verbose_name='Bills')),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total billed')),
+                ('unpaid', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Outstanding balance')),
+                ('closed_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='coworkers', to='billjobs.ClosedPeriod')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='Coworker')),
+            ],
+            options={
+                'verbose_name': 'Coworker rollup',
+            },
+        ),
+        migrations.CreateModel(
+            name='ServiceRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(blank=True, max_length=5, verbose_name='Reference')),
+                ('name', models.CharField(blank=True, max_length=128, verbose_name='Name')),
+                ('line_count', models.PositiveIntegerField(default=0, verbose_name='Bill Lines')),
+                ('quantity', models.IntegerField(default=0, verbose_name='Quantity')),
+                ('billed', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Total billed')),
+                ('closed_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='services', to='billjobs.ClosedPeriod')),
+            ],
+            options={
+                'verbose_name': 'Service rollup',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='coworkerrollup',
+            unique_together=set([('closed_period', 'user')]),
+        ),
+    ]
@@ -1,27 +1,69 @@
-from django.db import models
+from django.db import connection, models, transaction, IntegrityError
+from django.db.models import Case, Count, DecimalField, F, Max, Q, Sum, \
+        Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from django.db.models.signals import pre_save, post_save, post_delete
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import pre_save, post_save, pre_delete, \
+        post_delete, post_init
+from django.utils import timezone
 # TODO delete this import
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
-from .settings import BILLJOBS_BILL_ISSUER
+from .settings import BILLJOBS_BILL_ISSUER, BILLJOBS_PDF_PRERENDER
+from .cache import invalidate_bill_pdf, invalidate_force_user_group, \
+        invalidate_reports
+from contextlib import contextmanager
 import datetime
+import threading
+import uuid
+
+
+class BillManager(models.Manager):
+
+    def bulk_create_for_users(self, users, billing_date=None, **fields):
+        """ Create an empty bill for each user and return them
+
+        Users are instances or ids. Billing addresses are read with one query
+        and numbers of the month of billing_date, today by default, are
+        reserved at once. Like bulk_create, save() and signals are skipped:
+        add lines, then update amounts and billing summaries of the bills.
+        """
+        user_ids = [getattr(user, 'pk', user) for user in users]
+        addresses = dict(UserProfile.objects.filter(user_id__in=user_ids)
+                .values_list('user_id', 'billing_address'))
+        bills = [self.model(user_id=user_id, number=number,
+                    billing_address=addresses.get(user_id, ''), **fields)
+                for user_id, number in zip(user_ids,
+                    reserve_bill_numbers(len(user_ids), billing_date))]
+        self.bulk_create(bills)
+        inserted = self.filter(number__in=[bill.number for bill in bills])
+        if billing_date is not None:
+            # auto_now_add dates inserted rows today
+            inserted.update(billing_date=billing_date)
+            for bill in bills:
+                bill.billing_date = billing_date
+        # only PostgreSQL returns ids of inserted rows, find them by number
+        bill_ids = dict(inserted.values_list('number', 'pk'))
+        for bill in bills:
+            bill.pk = bill_ids[bill.number]
+        return bills
 
 
 @python_2_unicode_compatible
 class Bill(models.Model):
 
     user = models.ForeignKey(User, verbose_name=_('Coworker'))
-    number = models.CharField(max_length=10, unique=True, blank=True, 
+    number = models.CharField(max_length=16, unique=True, blank=True, 
             verbose_name=_('Bill number'),
             help_text=_('This value is set automatically.'))
-    isPaid = models.BooleanField(default=False, 
+    isPaid = models.BooleanField(default=False, db_index=True,
             verbose_name=_('Bill is paid ?'),
             help_text=_('Check this value when bill is paid'))
     billing_date = models.DateField(auto_now_add=True,verbose_name=_('Date'),
             help_text=_('This value is set automatically.'))
-    amount = models.FloatField(blank=True, default=0, 
+    amount = models.DecimalField(max_digits=12, decimal_places=2,
+            blank=True, default=0,
             verbose_name=_('Bill total amount'),
             help_text=_('The amount is computed automatically.'))
     issuer_address = models.CharField(max_length=1024, blank=False, 
@@ -35,13 +77,25 @@ class Bill(models.Model):
         return '%s %s' % (self.user.first_name, self.user.last_name)
     coworker_name.short_description = _('Coworker name')
 
+    objects = BillManager()
+
     class Meta:
         verbose_name = _('Bill')
+        # billing date lookups and keyset pagination use the second index
+        index_together = [('user', 'billing_date'), ('billing_date', 'id')]
 
     def save(self, *args, **kwargs):
         if not self.billing_address:
-            self.billing_address = self.user.userprofile.billing_address
-        super(Bill,self).save(*args,**kwargs)
+            if Bill.user.is_cached(self) or self.user_id is None:
+                # reuse profile already loaded with the user
+                self.billing_address = self.user.userprofile.billing_address
+            else:
+                self.billing_address = UserProfile.objects.values_list(
+                        'billing_address', flat=True).get(user_id=self.user_id)
+        # summaries are updated by difference with the row as it is saved
+        with transaction.atomic(savepoint=False):
+            self._billing_state = locked_billing_state(self.pk)
+            super(Bill,self).save(*args,**kwargs)
 
 
 @python_2_unicode_compatible
@@ -52,9 +106,10 @@ class Service(models.Model):
     description = models.CharField(max_length=256,
             verbose_name=_('Description'),
             help_text=_('Write service description limited to 256 characters'))
-    price = models.FloatField(verbose_name=_('Price'))
+    price = models.DecimalField(max_digits=10, decimal_places=2,
+            verbose_name=_('Price'))
     is_available = models.BooleanField(verbose_name=_('Is available ?'),
-            default=True)
+            default=True, db_index=True)
 
     def __str__(self):
         """ Return name as object representation """
@@ -67,8 +122,18 @@ class BillLine(models.Model):
 
     bill = models.ForeignKey(Bill)
     service = models.ForeignKey(Service)
+    # service as it was when the line was billed, invoices never change
+    reference = models.CharField(max_length=5, blank=True, default='',
+            verbose_name=_('Reference'))
+    name = models.CharField(max_length=128, blank=True, default='',
+            verbose_name=_('Name'))
+    description = models.CharField(max_length=256, blank=True, default='',
+            verbose_name=_('Description'))
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2,
+            blank=True, verbose_name=_('Unit price'),
+            help_text=_('This value is set automatically.'))
     quantity = models.SmallIntegerField(default=1, verbose_name=_('Quantity'))
-    total = models.FloatField(blank=True,
+    total = models.DecimalField(max_digits=12, decimal_places=2, blank=True,
             help_text=_('This value is computed automatically'), 
             verbose_name=_('Total'))
     note = models.CharField(max_length=1024, verbose_name=_('Note'), 
@@ -80,6 +145,40 @@ class BillLine(models.Model):
         verbose_name = _('Bill Line')
         verbose_name_plural = _('Bill Lines')
 
+class BillNumberSequence(models.Model):
+    """ Last bill number given in a month """
+    period = models.CharField(max_length=6, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = _('Bill number sequence')
+
+
+class Subscription(models.Model):
+    """ Service billed to a user every month """
+    user = models.ForeignKey(User, verbose_name=_('Coworker'))
+    service = models.ForeignKey(Service, verbose_name=_('Service'))
+    quantity = models.SmallIntegerField(default=1, verbose_name=_('Quantity'))
+    is_active = models.BooleanField(default=True,
+            verbose_name=_('Is active ?'),
+            help_text=_('Uncheck this value to stop billing this service'))
+
+    class Meta:
+        verbose_name = _('Subscription')
+
+
+class BillingRun(models.Model):
+    """ Period whose subscriptions have been billed """
+    period = models.CharField(max_length=7, unique=True,
+            verbose_name=_('Period'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    bill_count = models.PositiveIntegerField(default=0,
+            verbose_name=_('Bills'))
+
+    class Meta:
+        verbose_name = _('Billing run')
+
+
 class UserProfile(models.Model):
     """ extend User class """
     user = models.OneToOneField(User)
@@ -91,11 +190,197 @@ class UserProfile(models.Model):
         verbose_name_plural = _('User Profiles')
 
 
+class UserBillingSummary(models.Model):
+    """ Billing totals of a user, updated by bills signals """
+    user = models.OneToOneField(User, primary_key=True,
+            related_name='billing_summary')
+    bill_count = models.PositiveIntegerField(default=0,
+            verbose_name=_('Bills'))
+    total_billed = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Total billed'))
+    total_unpaid = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Outstanding balance'))
+    last_billing_date = models.DateField(null=True, blank=True,
+            verbose_name=_('Last bill date'))
+
+    class Meta:
+        verbose_name = _('User billing summary')
+        verbose_name_plural = _('User billing summaries')
+
+
+class ClosedPeriod(models.Model):
+    """ Totals of a closed month, its reports are read from rollups """
+    period = models.CharField(max_length=7, unique=True,
+            verbose_name=_('Period'))
+    closed_at = models.DateTimeField(auto_now_add=True)
+    bill_count = models.PositiveIntegerField(default=0,
+            verbose_name=_('Bills'))
+    billed = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Total billed'))
+    unpaid = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Outstanding balance'))
+
+    class Meta:
+        verbose_name = _('Closed period')
+
+
+class ServiceRollup(models.Model):
+    """ Lines of a service billed in a closed month """
+    closed_period = models.ForeignKey(ClosedPeriod, related_name='services')
+    reference = models.CharField(max_length=5, blank=True,
+            verbose_name=_('Reference'))
+    name = models.CharField(max_length=128, blank=True,
+            verbose_name=_('Name'))
+    line_count = models.PositiveIntegerField(default=0,
+            verbose_name=_('Bill Lines'))
+    quantity = models.IntegerField(default=0, verbose_name=_('Quantity'))
+    billed = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Total billed'))
+
+    class Meta:
+        verbose_name = _('Service rollup')
+
+
+class CoworkerRollup(models.Model):
+    """ Bills of a user in a closed month """
+    closed_period = models.ForeignKey(ClosedPeriod, related_name='coworkers')
+    user = models.ForeignKey(User, verbose_name=_('Coworker'))
+    bill_count = models.PositiveIntegerField(default=0,
+            verbose_name=_('Bills'))
+    billed = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Total billed'))
+    unpaid = models.DecimalField(max_digits=14, decimal_places=2,
+            default=0, verbose_name=_('Outstanding balance'))
+
+    class Meta:
+        verbose_name = _('Coworker rollup')
+        unique_together = ('closed_period', 'user')
+
+
+class PdfRenderJobManager(models.Manager):
+
+    def enqueue(self, bill_id):
+        """ Ask for the pdf of a bill to be rendered, once per bill """
+        jobs = self.filter(bill_id=bill_id)
+        # a bill changing while its pdf is rendered is rendered again
+        updated = jobs.update(requested_at=timezone.now(), locked_until=None)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    self.create(bill_id=bill_id)
+            except IntegrityError:
+                # another writer enqueued this bill
+                pass
+
+    def claim(self, batch_size=10, lock_seconds=300, max_attempts=3):
+        """ Lock jobs for a worker and return them
+
+        Jobs are locked until a deadline, a job whose worker died is claimed
+        again once it is over. Where supported, concurrent workers skip rows
+        selected by others instead of waiting for them.
+        """
+        now = timezone.now()
+        worker = uuid.uuid4().hex
+        available = self.filter(
+                Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+                attempts__lt=max_attempts)
+        candidates = available.order_by('requested_at') \
+                .values_list('pk', flat=True)
+
+        def lock(job_ids):
+            # an UPDATE checks availability again, only one worker wins a job
+            available.filter(pk__in=job_ids).update(
+                    worker=worker,
+                    locked_until=now + datetime.timedelta(seconds=lock_seconds),
+                    attempts=F('attempts') + 1)
+
+        if getattr(connection.features,
+                'has_select_for_update_skip_locked', False):
+            with transaction.atomic():
+                lock(list(candidates.select_for_update(
+                    skip_locked=True)[:batch_size]))
+        else:
+            lock(list(candidates[:batch_size]))
+        return list(self.filter(worker=worker))
+
+    def complete(self, job):
+        """ Remove a job unless its bill changed since it was claimed """
+        self.filter(pk=job.pk, requested_at=job.requested_at).delete()
+
+    def drop_abandoned(self, max_attempts=3):
+        """ Remove jobs which failed max_attempts times, return their bills
+
+        They are never claimed again, a change of their bill queues it anew.
+        """
+        jobs = self.filter(attempts__gte=max_attempts,
+                locked_until__lt=timezone.now())
+        bill_ids = list(jobs.values_list('bill_id', flat=True))
+        if bill_ids:
+            jobs.filter(bill_id__in=bill_ids).delete()
+        return bill_ids
+
+
+class PdfRenderJob(models.Model):
+    """ Bill waiting for its pdf to be rendered by a worker """
+    bill = models.OneToOneField(Bill)
+    requested_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=32, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    objects = PdfRenderJobManager()
+
+    class Meta:
+        verbose_name = _('Pdf render job')
+
+
 @receiver(pre_save, sender=BillLine)
 def compute_total(sender, instance, **kwargs):
         """ set total of line automatically """
+        # loaded fixtures keep lines as they were billed
+        if kwargs.get('raw'):
+            return
+        if instance.unit_price is None \
+                or instance.service_id != instance._billed_service_id:
+            freeze_service(instance, instance.service)
         if not instance.total:
-            instance.total = instance.service.price * instance.quantity
+            instance.total = instance.unit_price * instance.quantity
+
+def freeze_service(line, service):
+    """ Copy service fields printed on invoice into a bill line """
+    line.reference = service.reference
+    line.name = service.name
+    line.description = service.description
+    line.unit_price = service.price
+
+@receiver(post_init, sender=BillLine)
+def billline_post_init(sender, instance, **kwargs):
+    """ Remember loaded service to take a new snapshot when it changes """
+    instance._billed_service_id = instance.__dict__.get('service_id')
+
+def reserve_bill_numbers(count=1, date=None):
+    """ Reserve count consecutive bill numbers in the month of date
+
+    Numbers restart from 001 every month. The sequence row is updated before
+    being read, so concurrent writers wait for the row lock (or the database
+    lock with SQLite) and never get the same number.
+    """
+    period = (date or datetime.date.today()).strftime('%Y%m')
+    sequence = BillNumberSequence.objects.filter(period=period)
+    with transaction.atomic():
+        updated = sequence.update(last_value=F('last_value') + count)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    BillNumberSequence.objects.create(
+                            period=period, last_value=count)
+            except IntegrityError:
+                # another writer created the sequence of this month
+                sequence.update(last_value=F('last_value') + count)
+        last_value = sequence.values_list('last_value', flat=True).get()
+
+    return ['F%s%03d' % (period, value)
+            for value in range(last_value - count + 1, last_value + 1)]
 
 @receiver(pre_save, sender=Bill)
 def define_number(sender, instance, **kwargs):
@@ -103,17 +388,7 @@ def define_number(sender, instance, **kwargs):
 
     # only when we create record for the first time
     if not instance.number:
-        today = datetime.date.today()
-        # get last id in base, we assume it's the last record
-        try:
-            last_record = sender.objects.latest('id')
-            #get last bill number and increment it
-            last_num = '%03d' % (int(last_record.number[-3:])+1)
-        # no Bill in db
-        except sender.DoesNotExist:
-            last_num = '001'
-
-        instance.number = 'F%s%s' % (today.strftime('%Y%m'), last_num)
+        instance.number = reserve_bill_numbers()[0]
 
 @receiver(pre_save, sender=Bill)
 def bill_pre_save(sender, instance, **kwargs):
@@ -129,15 +404,260 @@ def bill_billLine_post_save_and_delete(sender, instance, **kwargs):
         When admin modify or delete a BillLine, Bill instance has no change, so
         the pre_save is not called and total amount is not computed.
     """
-    set_bill_amount(sender, instance.bill, **kwargs)
+    # lines of a deleted bill are deleted first, the bill will be gone
+    if instance.bill_id in deleted_bill_ids():
+        return
+    deferred_bills = getattr(_deferred, 'bills', None)
+    if deferred_bills is not None:
+        deferred_bills[instance.bill_id] = instance.bill
+    else:
+        set_bill_amount(sender, instance.bill, **kwargs)
+        request_pdf_render(instance.bill_id)
 
 def set_bill_amount(sender, instance, **kwargs):
     """ set total price of billing when saving """
-    # reset self.amount in case is already set
     bill = instance
-    bill.amount = 0
-    for line in bill.billline_set.all():
-        bill.amount += line.total
+    # a new bill has no line yet
+    if bill.pk is None:
+        bill.amount = 0
+        return
+    if sender is Bill:
+        bill.amount = bill.billline_set.aggregate(
+                amount=Sum('total'))['amount'] or 0
+        return
+
+    # only update amount column, saving bill would compute it again
+    with transaction.atomic(savepoint=False):
+        old = locked_billing_state(bill.pk)
+        bill.amount = bill.billline_set.aggregate(
+                amount=Sum('total'))['amount'] or 0
+        if old is None:
+            return
+        Bill.objects.filter(pk=bill.pk).update(amount=bill.amount)
+        user_id, amount, is_paid, billing_date = old
+        update_billing_summary(old,
+                (user_id, bill.amount, is_paid, billing_date))
+    invalidate_reports(bill.billing_date)
+
+_deferred = threading.local()
+
+@contextmanager
+def defer_bill_amount():
+    """ Compute amount of bills once, when leaving the block
+
+    Saving or deleting many lines of a bill, as admin inline formset does,
+    then costs a single aggregate and update per bill. Use it inside
+    transaction.atomic() to recompute amounts once per transaction.
+    """
+    # nested blocks are computed by the outer one
+    if getattr(_deferred, 'bills', None) is not None:
+        yield
+        return
+
+    _deferred.bills = bills = {}
+    try:
+        yield
+    finally:
+        _deferred.bills = None
+    for bill in bills.values():
+        set_bill_amount(BillLine, bill)
+        request_pdf_render(bill.id)
+
+_deleted = threading.local()
+
+def deleted_bill_ids():
+    """ Return ids of bills being deleted in this thread """
+    if not hasattr(_deleted, 'ids'):
+        _deleted.ids = set()
+    return _deleted.ids
+
+@receiver(pre_delete, sender=Bill)
+def bill_pre_delete(sender, instance, **kwargs):
+    """ Remember bill is deleted while its lines are deleted """
+    deleted_bill_ids().add(instance.id)
+    instance._billing_state = locked_billing_state(instance.id)
+
+@receiver(post_delete, sender=Bill)
+def bill_post_delete(sender, instance, **kwargs):
+    deleted_bill_ids().discard(instance.id)
+
+def request_pdf_render(bill_id):
+    """ Enqueue pdf rendering of a bill when pre-rendering is enabled """
+    if BILLJOBS_PDF_PRERENDER:
+        PdfRenderJob.objects.enqueue(bill_id)
+
+@receiver(post_save, sender=Bill)
+def bill_post_save_render(sender, instance, **kwargs):
+    """ Render pdf of a created, paid or changed bill ahead of download """
+    request_pdf_render(instance.id)
+
+# values of a bill counted in billing summary of its user
+BILLING_STATE_FIELDS = ('user_id', 'amount', 'isPaid', 'billing_date')
+
+def locked_billing_state(bill_id):
+    """ Return values of a bill row counted in billing summaries, None if
+    it does not exist
+
+    The row is locked until the end of the transaction, concurrent changes
+    of the bill are counted one after the other.
+    """
+    if bill_id is None:
+        return None
+    return Bill.objects.select_for_update().filter(pk=bill_id) \
+            .values_list(*BILLING_STATE_FIELDS).first()
+
+def billing_state(bill, old=None, update_fields=None):
+    """ Return values of a bill as saved, old values for skipped fields """
+    if update_fields is None or old is None:
+        return tuple(getattr(bill, name) for name in BILLING_STATE_FIELDS)
+    # update_fields holds names or attnames, user or user_id
+    return tuple(getattr(bill, name)
+            if {name, name.replace('_id', '')} & set(update_fields) else old[i]
+            for i, name in enumerate(BILLING_STATE_FIELDS))
+
+@receiver(post_save, sender=Bill)
+def bill_post_save_summary(sender, instance, created, raw, update_fields,
+        **kwargs):
+    if raw and not created:
+        # loaded fixture overwrites a row that was not read
+        rebuild_billing_summaries([instance.user_id])
+        return
+    old = None if created else instance._billing_state
+    update_billing_summary(old,
+            billing_state(instance, old, update_fields))
+
+@receiver(post_delete, sender=Bill)
+def bill_post_delete_summary(sender, instance, **kwargs):
+    update_billing_summary(instance._billing_state, None)
+
+def update_billing_summary(old, new):
+    """ Add the difference between new and old values of a bill row to
+    billing summaries, with one UPDATE per user concerned
+
+    Values are None when the bill does not exist.
+    """
+    if old == new:
+        return
+    update_closed_periods(old, new)
+
+    deltas = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        user_id, amount, is_paid, billing_date = state
+        delta = deltas.setdefault(user_id, [0, 0, 0, None])
+        delta[0] += sign
+        delta[1] += sign * amount
+        if not is_paid:
+            delta[2] += sign * amount
+        if sign > 0:
+            delta[3] = billing_date
+    for user_id, delta in deltas.items():
+        add_to_billing_summary(user_id, *delta)
+
+def add_to_billing_summary(user_id, bill_count, amount, unpaid,
+        billing_date=None):
+    """ Add differences to billing summary of a user """
+    changes = dict(
+            bill_count=F('bill_count') + bill_count,
+            total_billed=F('total_billed') + amount,
+            total_unpaid=F('total_unpaid') + unpaid)
+    if bill_count < 0:
+        # a bill was removed, it may be the last one
+        changes['last_billing_date'] = Bill.objects.filter(user_id=user_id) \
+                .aggregate(last=Max('billing_date'))['last']
+    elif billing_date is not None:
+        date = Value(billing_date, output_field=models.DateField())
+        changes['last_billing_date'] = Coalesce(
+                Greatest('last_billing_date', date), date)
+    updated = UserBillingSummary.objects.filter(user_id=user_id) \
+            .update(**changes)
+    if not updated:
+        # first bill of user, compute it from bills
+        rebuild_billing_summaries([user_id])
+
+def is_closed(period, today=None):
+    """ Return True when no bill can be added to a YYYY-MM period anymore """
+    today = today or datetime.date.today()
+    return period < today.strftime('%Y-%m')
+
+def reopen_period(billing_date):
+    """ Drop rollups of the month of billing_date if it was closed """
+    if billing_date is None:
+        return
+    period = billing_date.strftime('%Y-%m')
+    if is_closed(period):
+        ClosedPeriod.objects.filter(period=period).delete()
+
+def update_closed_periods(old, new):
+    """ Keep rollups of closed months in line with a changed bill row
+
+    Old values are read from the locked row, a payment saved twice flips
+    isPaid once and only moves unpaid amounts of the month and of its
+    coworker once. Any other change reopens the month: its reports are
+    aggregated from bills until it is closed again.
+    """
+    if old is None or new is None or old[:2] != new[:2] or old[3] != new[3]:
+        for state in (old, new):
+            if state is not None:
+                reopen_period(state[3])
+        return
+    user_id, amount, is_paid, billing_date = new
+    if billing_date is None:
+        return
+    period = billing_date.strftime('%Y-%m')
+    if not is_closed(period):
+        return
+    unpaid = -amount if is_paid else amount
+    if ClosedPeriod.objects.filter(period=period) \
+            .update(unpaid=F('unpaid') + unpaid):
+        CoworkerRollup.objects.filter(closed_period__period=period,
+                user_id=user_id).update(unpaid=F('unpaid') + unpaid)
+
+def rebuild_billing_summaries(user_ids):
+    """ Compute billing summaries of users from their bills """
+    totals = Bill.objects.filter(user_id__in=user_ids).order_by() \
+            .values('user_id').annotate(
+                    bill_count=Count('id'),
+                    total_billed=Sum('amount'),
+                    total_unpaid=Sum(Case(
+                        When(isPaid=False, then='amount'),
+                        default=Value(0),
+                        output_field=DecimalField())),
+                    last_billing_date=Max('billing_date'))
+    with transaction.atomic():
+        UserBillingSummary.objects.filter(user_id__in=user_ids).delete()
+        UserBillingSummary.objects.bulk_create(
+                UserBillingSummary(**total) for total in totals)
+
+@receiver(post_save, sender=Bill)
+@receiver(post_delete, sender=Bill)
+def bill_post_save_and_delete(sender, instance, **kwargs):
+    """ Drop the cached pdf of a bill when it changes """
+    invalidate_bill_pdf(instance.id)
+
+@receiver(post_save, sender=Bill)
+@receiver(post_delete, sender=Bill)
+def bill_post_save_and_delete_reports(sender, instance, **kwargs):
+    """ Drop cached reports of the month of a bill when it changes """
+    invalidate_reports(instance.billing_date)
+
+@receiver(post_save, sender=BillLine)
+@receiver(post_delete, sender=BillLine)
+def billline_post_save_and_delete(sender, instance, **kwargs):
+    """ Drop the cached pdf of a bill when one of its lines changes """
+    invalidate_bill_pdf(instance.bill_id)
+
+@receiver(post_save, sender=BillLine)
+@receiver(post_delete, sender=BillLine)
+def billline_post_save_and_delete_rollups(sender, instance, **kwargs):
+    """ Reopen the closed month of a bill when one of its lines changes """
+    # a deleted bill reopens its month itself
+    if instance.bill_id not in deleted_bill_ids():
+        reopen_period(instance.bill.billing_date)
 
-    if sender is not Bill:
-        bill.save()
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_post_save_and_delete(sender, instance, **kwargs):
+    """ Drop the cached id of the group forced on new users """
+    invalidate_force_user_group()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import BaseDocTemplate, Frame, KeepTogether, \
+        LongTable, PageTemplate, Paragraph, Spacer, Table, TableStyle
+from io import BytesIO
+from .settings import BILLJOBS_DEBUG_PDF, BILLJOBS_BILL_LOGO_PATH, \
+        BILLJOBS_BILL_LOGO_WIDTH, BILLJOBS_BILL_LOGO_HEIGHT, \
+        BILLJOBS_BILL_PAYMENT_INFO
+from .invoice import Invoice
+from .metrics import measure_pdf_render
+from textwrap import wrap
+import threading
+
+
+class InvoiceTemplate(object):
+    """ Layout resources shared by every invoice
+
+    Use get_invoice_template() to build it once per process. Logo, styles and
+    table styles are only read once built, so threads share them. Paragraphs
+    keep their layout state, they are laid out once per thread.
+
+    Bill lines are a table split on as many pages as needed, its header row
+    is repeated on each page. First page starts with the bill header, other
+    pages with the bill number, every page ends with a footer.
+    """
+
+    lh = 15  # define a line height
+    max_paragraphs = 32
+
+    def __init__(self):
+        # define document width and height with cm as margin
+        width, height = A4
+        self.width = width - 2*cm
+        self.height = height - 2*cm
+
+        self.logo = ImageReader(BILLJOBS_BILL_LOGO_PATH)
+        # decode logo now, drawing it only reads decoded data
+        self.logo.getRGBData()
+        self.style = getSampleStyleSheet()['Normal']
+
+        # widths in percent of pdf width
+        self.col_widths = (self.width*0.55, self.width*0.15,
+                self.width*0.15, self.width*0.15)
+        self.lines_style = TableStyle([
+            ('GRID', (0, 0), (-1, 0), 1, colors.black),
+            ('BOX', (0, 1), (0, -1), 1, colors.black),
+            ('BOX', (1, 1), (1, -1), 1, colors.black),
+            ('BOX', (2, 1), (2, -1), 1, colors.black),
+            ('BOX', (-1, 1), (-1, -1), 1, colors.black),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+            ])
+        self.totals_style = TableStyle([
+            ('GRID', (-2, 0), (-1, -1), 1, colors.black),
+            ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (-1, -1), 'CENTER'),
+            ('ALIGN', (-1, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
+            ])
+        # bill lines start below bill header on first page, below bill
+        # number on other pages, and end above footer
+        self.first_frame_top = self.height - 90 - 10*self.lh
+        self.later_frame_top = self.height - 3*self.lh
+        self.frame_bottom = 3*self.lh
+
+        self._local = threading.local()
+        # payment info is the same for every invoice, lay it out now
+        self.paragraph(BILLJOBS_BILL_PAYMENT_INFO, self.width*0.6, 100)
+
+    def paragraph(self, text, width, height):
+        """ Return a paragraph laid out in width, cached for this thread """
+        paragraphs = getattr(self._local, 'paragraphs', None)
+        # issuer address is a bill field, do not keep too many of them
+        if paragraphs is None or len(paragraphs) >= self.max_paragraphs:
+            paragraphs = self._local.paragraphs = {}
+        key = (text, width, height)
+        if key not in paragraphs:
+            paragraph = Paragraph(text, self.style)
+            paragraph.wrap(width, height)
+            paragraphs[key] = paragraph
+        return paragraphs[key]
+
+    def frame(self, top):
+        """ Frame of bill lines from top to footer, without padding """
+        return Frame(cm, cm + self.frame_bottom, self.width,
+                top - self.frame_bottom, leftPadding=0, rightPadding=0,
+                topPadding=0, bottomPadding=0)
+
+    def draw_page(self, pdf, doc):
+        """ Draw footer and debug limits of every page """
+        width, height, lh = self.width, self.height, self.lh
+        pdf.saveState()
+        # define new 0,0 bottom left with cm as margin
+        pdf.translate(cm, cm)
+
+        # if debug draw lines for document limit
+        if BILLJOBS_DEBUG_PDF is True:
+            pdf.setStrokeColorRGB(1, 0, 0)
+            pdf.line(0, 0, width, 0)
+            pdf.line(0, 0, 0, height)
+            pdf.line(0, height, width, height)
+            pdf.line(width, height, width, 0)
+
+        pdf.setStrokeColorRGB(0, 0, 0)
+        pdf.setFillColorRGB(0.3, 0.3, 0.3)
+        pdf.line(0, 2*lh, width, 2*lh)
+        pdf.setFont("Helvetica", 8)
+        pdf.drawCentredString(width/2.0, lh, 'Association Loi 1901')
+        pdf.drawRightString(width, lh, 'Page {}'.format(doc.page))
+        pdf.restoreState()
+
+    def draw_first_page(self, pdf, doc, invoice):
+        """ Draw logo, bill information, issuer and customer addresses """
+        width, height, lh = self.width, self.height, self.lh
+        self.draw_page(pdf, doc)
+        pdf.saveState()
+        pdf.translate(cm, cm)
+
+        # Put logo on top of pdf original image size is 570px/250px
+        pdf.drawImage(
+                self.logo,
+                0,
+                height-BILLJOBS_BILL_LOGO_HEIGHT,
+                width=BILLJOBS_BILL_LOGO_WIDTH,
+                height=BILLJOBS_BILL_LOGO_HEIGHT
+                )
+        # billing information
+        pdf.setFillColorRGB(0.3, 0.3, 0.3)
+        pdf.setFont("Helvetica-Bold", 14)
+        pdf.drawRightString(width, height-lh, 'Facture')
+        pdf.setFont("Helvetica-Bold", 10)
+        pdf.drawRightString(
+                width, height-2*lh, u'Numéro : %s' % invoice.number)
+        pdf.setFont("Helvetica", 10)
+        pdf.drawRightString(
+                width,
+                height-3*lh,
+                u'Date facturation : {}'.format(
+                    invoice.billing_date.strftime('%d/%m/%Y'))
+                )
+
+        # define new height
+        nh = height - 90
+
+        # seller
+        pdf.setFillColorRGB(0.95, 0.95, 0.95)
+        pdf.setStrokeColorRGB(1, 1, 1)
+        # rect(x,y,width,height)
+        pdf.rect(0, nh-8*lh, width/2-40, 6.4*lh, fill=1)
+        # reset fill for text color
+        pdf.setFillColorRGB(0.3, 0.3, 0.3)
+        pdf.drawString(10, nh-lh, 'Émetteur')
+        issuer = self.paragraph(invoice.issuer_address, width*0.25, 6*lh)
+        issuer.drawOn(pdf, 20, nh-6*lh)
+
+        # customer
+        pdf.drawString(width/2, nh-lh, 'Adressé à')
+        customer = pdf.beginText()
+        customer.setTextOrigin(width/2+20, nh-3*lh)
+        # create text with \n and remove \r
+        text = '{}\n{}'.format(
+                invoice.customer_name,
+                invoice.billing_address.replace('\r', '')
+                )
+        # get each line
+        for line in text.split('\n'):
+            customer.textOut(line)
+            customer.moveCursor(0, lh)
+        pdf.drawText(customer)
+        pdf.setStrokeColorRGB(0, 0, 0)
+        # rect(x,y,width,height)
+        pdf.rect(width/2, nh-8*lh, width/2, 6.4*lh, fill=0)
+        pdf.restoreState()
+
+    def draw_later_page(self, pdf, doc, invoice):
+        """ Remind bill number on top of pages after the first one """
+        self.draw_page(pdf, doc)
+        pdf.saveState()
+        pdf.translate(cm, cm)
+        pdf.setFillColorRGB(0.3, 0.3, 0.3)
+        pdf.setFont("Helvetica-Bold", 10)
+        pdf.drawRightString(self.width, self.height-self.lh,
+                u'Facture {} (suite)'.format(invoice.number))
+        pdf.restoreState()
+
+    def lines_table(self, invoice):
+        """ Table of bill lines, header row is repeated on each page """
+        data = [['Désignation', 'Prix unit. HT', 'Quantité', 'Total HT']]
+
+        for line in invoice.lines:
+            description = '{} - {}\n{}'.format(
+                    line.reference,
+                    line.name,
+                    '\n'.join(wrap(line.description, 62)))
+
+            if line.note:
+                description = '{}\n{}'.format(
+                        description,
+                        '\n'.join(wrap(line.note, 62)))
+
+            data.append((description, line.price, line.quantity, line.total))
+
+        return LongTable(data, colWidths=self.col_widths,
+                style=self.lines_style, repeatRows=1)
+
+    def totals_table(self, invoice):
+        data = [
+                ('TVA non applicable art-293B du CGI', '', 'Total HT',
+                    '{} €'.format(invoice.amount)),
+                ('', '', 'TVA 0%', '0'),
+                ('', '', 'Total TTC', '{} €.'.format(invoice.amount)),
+                ]
+        return Table(data, colWidths=self.col_widths, style=self.totals_style)
+
+    def payment_info(self):
+        """ Payment information on the left of the page """
+        return Table(
+                [[self.paragraph(
+                    BILLJOBS_BILL_PAYMENT_INFO, self.width*0.6, 100)]],
+                colWidths=(self.width*0.6,), hAlign='LEFT',
+                style=[('LEFTPADDING', (0, 0), (-1, -1), 0)])
+
+    def render(self, invoice):
+        ''' Render an invoice snapshot and return pdf content as bytes '''
+        # Create a buffer
+        buffer = BytesIO()
+        # page templates keep layout state, create them for each document
+        doc = BaseDocTemplate(buffer, pagesize=A4, pageTemplates=[
+            PageTemplate(
+                id='first',
+                frames=[self.frame(self.first_frame_top)],
+                onPage=lambda pdf, doc: self.draw_first_page(
+                    pdf, doc, invoice),
+                autoNextPageTemplate='later'),
+            PageTemplate(
+                id='later',
+                frames=[self.frame(self.later_frame_top)],
+                onPage=lambda pdf, doc: self.draw_later_page(
+                    pdf, doc, invoice)),
+            ])
+        doc.build([
+            self.lines_table(invoice),
+            # totals and payment information are never split
+            KeepTogether([
+                self.totals_table(invoice),
+                Spacer(0, 2*self.lh),
+                self.payment_info(),
+                ]),
+            ])
+        # get pdf from buffer
+        genpdf = buffer.getvalue()
+        buffer.close()
+        return genpdf
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_invoice_template():
+    ''' Return the invoice template of this process, build it if needed '''
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = InvoiceTemplate()
+    return _template
+
+
+def render_invoice(invoice):
+    ''' Render an invoice snapshot and return pdf content as bytes '''
+    with measure_pdf_render():
+        return get_invoice_template().render(invoice)
+
+
+def render_bill(bill):
+    ''' Render the invoice of a bill and return pdf content as bytes '''
+    return render_invoice(Invoice.from_bill(bill))
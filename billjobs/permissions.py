@@ -1,6 +1,42 @@
 from rest_framework import permissions
 from rest_framework.compat import is_authenticated
 
+class RequestUser(object):
+    """
+    Staff status and groups of the user of a request, read once
+
+    Permission classes are called for the view and for each object, they
+    share this memo instead of asking the database every time.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.is_staff = bool(user and user.is_staff)
+        self.is_authenticated = bool(user and is_authenticated(user))
+        self._group_ids = None
+
+    @property
+    def group_ids(self):
+        """
+        Set of id of user groups, fetched with one query on first use
+        """
+        if self._group_ids is None:
+            self._group_ids = frozenset(
+                    self.user.groups.values_list('id', flat=True)
+                    if self.is_authenticated else ())
+        return self._group_ids
+
+def request_user(request):
+    """
+    Return RequestUser of request, created on first call
+    """
+    memo = getattr(request, '_billjobs_user', None)
+    # authentication may replace the user during the request
+    if memo is None or memo.user is not request.user:
+        memo = RequestUser(request.user)
+        request._billjobs_user = memo
+    return memo
+
 class CustomGroupAPIPermission(permissions.BasePermission):
     """
     Set custom permission for GroupAPI
@@ -14,14 +50,11 @@ class CustomGroupAPIPermission(permissions.BasePermission):
         Define permission based on request
         """
         if request.method == 'GET':
-            return (
-                request.user and
-                request.user.is_staff or
-                is_authenticated(request.user)
-                )
+            user = request_user(request)
+            return user.is_staff or user.is_authenticated
         elif request.method in ('POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS',
                 'HEAD'):
-            return request.user and request.user.is_staff
+            return request_user(request).is_staff
 
         return False
 
@@ -43,14 +76,11 @@ class CustomGroupDetailAPIPermission(permissions.BasePermission):
         Define permissions base on request.method
         """
         if request.method == 'GET':
-            return (
-                    request.user and
-                    request.user.is_staff or
-                    is_authenticated(request.user)
-                    )
+            user = request_user(request)
+            return user.is_staff or user.is_authenticated
         elif request.method in ('POST', 'PUT', 'DELETE', 'PATCH', 'OPTIONS',
                 'HEAD'):
-            return request.user and request.user.is_staff
+            return request_user(request).is_staff
 
         return False
 
@@ -59,11 +89,10 @@ class CustomGroupDetailAPIPermission(permissions.BasePermission):
         User instance in request is member of the group in obj instance
         Allow object access only for GET method for user
         """
-        if request.method == 'GET':
-            for group in request.user.groups.all():
-                if group.id == obj.id:
-                    return True
-        return request.user.is_staff
+        user = request_user(request)
+        if request.method == 'GET' and obj.id in user.group_ids:
+            return True
+        return user.is_staff
 
 class CustomUserAPIPermission(permissions.BasePermission):
     """
@@ -79,17 +108,14 @@ class CustomUserAPIPermission(permissions.BasePermission):
         Define permission based on request method
         """
         if request.method == 'GET':
-            return (
-                request.user and
-                request.user.is_staff or
-                is_authenticated(request.user)
-                )
+            user = request_user(request)
+            return user.is_staff or user.is_authenticated
 
         elif request.method == 'POST':
             # is public
             return True
         # other HTTP method allowed to admin, others get 401/403
-        return request.user and request.user.is_staff
+        return request_user(request).is_staff
 
 class CustomUserDetailAPIPermission(permissions.BasePermission):
     """
@@ -105,15 +131,38 @@ class CustomUserDetailAPIPermission(permissions.BasePermission):
         Give permission for admin or user to access API
         """
         if request.method in ('GET', 'PUT', 'DELETE'):
-            return (
-                request.user and
-                request.user.is_staff or
-                is_authenticated(request.user)
-                )
-        return request.user and request.user.is_staff
+            user = request_user(request)
+            return user.is_staff or user.is_authenticated
+        return request_user(request).is_staff
 
     def has_object_permission(self, request, view, obj):
         """
         Compare User instance in request is equal to User instance in obj
         """
-        return request.user.is_staff or obj == request.user
+        return request_user(request).is_staff or obj == request.user
+
+class CustomBillAPIPermission(permissions.BasePermission):
+    """
+    Set custom permission for bill API, bills are read only
+
+    * GET   :
+        * admin can access all bills
+        * current user only his bills
+        * public is forbidden
+    """
+
+    def has_permission(self, request, view):
+        """
+        Give permission to read bills for admin and authenticated users
+        """
+        if request.method in permissions.SAFE_METHODS:
+            user = request_user(request)
+            return user.is_staff or user.is_authenticated
+        return False
+
+    def has_object_permission(self, request, view, obj):
+        """
+        Bill belongs to User instance in request
+        """
+        return request_user(request).is_staff or \
+                obj.user_id == request.user.id
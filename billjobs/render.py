@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from .metrics import measure_pdf_render, registry
+from .pdf import render_invoice
+from .settings import BILLJOBS_PDF_RENDER_PROCESSES, \
+        BILLJOBS_PDF_RENDER_QUEUE_SIZE
+import threading
+
+
+class PdfRenderBusy(Exception):
+    """ Invoice can not be rendered now, client should retry later """
+
+
+class RenderPool(object):
+    """ Render invoices in a bounded pool of worker processes
+
+    At most processes + queue_size invoices are rendered or waiting, others
+    are refused at once instead of piling up in request threads.
+    """
+
+    def __init__(self, processes, queue_size):
+        self.executor = ProcessPoolExecutor(processes)
+        self.size = processes + queue_size
+        self.depth = 0
+        self._lock = threading.Lock()
+
+    def release(self, future):
+        with self._lock:
+            self.depth -= 1
+
+    def submit(self, invoice):
+        """ Return a future of the pdf content of an invoice payload """
+        with self._lock:
+            if self.depth >= self.size:
+                raise PdfRenderBusy('Render queue is full')
+            self.depth += 1
+        try:
+            future = self.executor.submit(render_invoice, invoice)
+        except Exception:
+            self.release(None)
+            raise
+        future.add_done_callback(self.release)
+        return future
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    ''' Return the render pool of this process, None if disabled '''
+    global _pool
+    if not BILLJOBS_PDF_RENDER_PROCESSES:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RenderPool(BILLJOBS_PDF_RENDER_PROCESSES,
+                        BILLJOBS_PDF_RENDER_QUEUE_SIZE)
+    return _pool
+
+
+def reset_render_pool(pool):
+    ''' Replace a broken pool by a new one on next render '''
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown()
+
+
+def render_in_pool(invoice, timeout, late=None):
+    ''' Render an invoice payload in the pool and return pdf content
+
+    Raise PdfRenderBusy when the queue is full or the pdf is not rendered
+    within timeout seconds. A pdf rendered after timeout is given to late().
+    '''
+    pool = get_render_pool()
+    try:
+        future = pool.submit(invoice)
+        with measure_pdf_render():
+            return future.result(timeout)
+    except PdfRenderBusy:
+        registry.increment('billjobs_pdf_render_rejected_total',
+                'Invoices refused because the render queue is full')
+        raise
+    except TimeoutError:
+        registry.increment('billjobs_pdf_render_timeouts_total',
+                'Invoices not rendered before the render timeout')
+        if late is not None:
+            future.add_done_callback(
+                    lambda future: future.exception() is None
+                    and late(future.result()))
+        raise PdfRenderBusy(
+                'Invoice not rendered in {} seconds'.format(timeout))
+    except BrokenProcessPool:
+        # a rendering process died, next invoices get a new pool
+        reset_render_pool(pool)
+        raise PdfRenderBusy('Render pool is broken')
+
+
+registry.add_gauge('billjobs_pdf_render_queue_depth',
+        'Invoices rendered or waiting in the render pool of this process',
+        lambda: _pool.depth if _pool is not None else 0)
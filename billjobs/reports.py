@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+from django.db import transaction, IntegrityError
+from django.db.models import Case, Count, DecimalField, IntegerField, Q, \
+        Sum, Value, When
+from django.db.models.functions import TruncMonth
+from .cache import PERIOD_REPORTS, REPORT_KEY, get_reports_cache
+from .models import Bill, BillLine, ClosedPeriod, CoworkerRollup, \
+        ServiceRollup, is_closed
+from .settings import BILLJOBS_REPORTS_CACHE_TIMEOUT, \
+        BILLJOBS_REPORTS_CLOSED_CACHE_TIMEOUT
+import datetime
+import functools
+import operator
+
+# label, newest and oldest age in days of unpaid bills of each bucket
+AGING_BUCKETS = (
+        ('0-30', 0, 30),
+        ('31-60', 31, 60),
+        ('61-90', 61, 90),
+        ('90+', 91, None),
+        )
+
+UNPAID = Sum(Case(When(isPaid=False, then='amount'), default=Value(0),
+    output_field=DecimalField()))
+
+
+def parse_period(period):
+    """ Return first day of a YYYY-MM period, raise ValueError if invalid """
+    return datetime.datetime.strptime(period, '%Y-%m').date()
+
+
+def next_month(date):
+    """ Return first day of the month after date """
+    return (date.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def add_months(period, months):
+    """ Return the period months after period, before it if negative """
+    month = parse_period(period)
+    index = month.year * 12 + month.month - 1 + months
+    return '{}-{:02d}'.format(index // 12, index % 12 + 1)
+
+
+def month_periods(first, last):
+    """ Return YYYY-MM periods from first to last, both included """
+    periods = []
+    month = parse_period(first)
+    while month <= parse_period(last):
+        periods.append(month.strftime('%Y-%m'))
+        month = next_month(month)
+    return periods
+
+
+def cache_timeout(period):
+    """ Keep reports of closed months longer, their bills rarely change """
+    if is_closed(period):
+        return BILLJOBS_REPORTS_CLOSED_CACHE_TIMEOUT
+    return BILLJOBS_REPORTS_CACHE_TIMEOUT
+
+
+def cached_report(name, period, compute):
+    """ Return report of a period from cache, compute it when missing """
+    cache = get_reports_cache()
+    key = REPORT_KEY.format(name, period)
+    report = cache.get(key)
+    if report is None:
+        report = compute(period)
+        cache.set(key, report, cache_timeout(period))
+    return report
+
+
+def bills_of_months(first, last, prefix=''):
+    """ Filter on bills of periods from first to last, both included """
+    return Q(**{
+        prefix + 'billing_date__gte': parse_period(first),
+        prefix + 'billing_date__lt': next_month(parse_period(last)),
+        })
+
+
+def bills_of_periods(periods):
+    """ Filter on bills of sorted periods, consecutive ones in one range """
+    ranges = []
+    for period in periods:
+        if ranges and add_months(ranges[-1][1], 1) == period:
+            ranges[-1][1] = period
+        else:
+            ranges.append([period, period])
+    return functools.reduce(operator.or_,
+            (bills_of_months(first, last) for first, last in ranges))
+
+
+def compute_month_totals(periods):
+    """ Return bill count, billed and unpaid amounts by period, aggregated
+    from bills of sorted periods only
+    """
+    rows = Bill.objects.filter(bills_of_periods(periods)) \
+            .annotate(month=TruncMonth('billing_date')).values('month') \
+            .annotate(bill_count=Count('id'), billed=Sum('amount'),
+                    unpaid=UNPAID) \
+            .order_by('month')
+    return dict((row.pop('month').strftime('%Y-%m'), row) for row in rows)
+
+
+def revenue_by_month(first, last):
+    """ Return totals of each month from first to last period
+
+    Months missing in cache are read from closed periods with one query,
+    the others missing are aggregated from their bills with another one.
+    """
+    cache = get_reports_cache()
+    periods = month_periods(first, last)
+    keys = dict((REPORT_KEY.format('month', period), period)
+            for period in periods)
+    cached = dict((keys[key], report)
+            for key, report in cache.get_many(keys).items())
+    totals = dict(cached)
+    missing = [period for period in periods if period not in totals]
+    if missing and is_closed(missing[0]):
+        totals.update((row.pop('period'), row) for row in ClosedPeriod.objects
+                .filter(period__in=missing)
+                .values('period', 'bill_count', 'billed', 'unpaid'))
+        missing = [period for period in missing if period not in totals]
+    if missing:
+        computed = compute_month_totals(missing)
+        for period in missing:
+            totals[period] = computed.get(period,
+                    dict(bill_count=0, billed=0, unpaid=0))
+    for period in periods:
+        if period not in cached:
+            cache.set(REPORT_KEY.format('month', period),
+                    totals[period], cache_timeout(period))
+    return [dict(totals[period], period=period) for period in periods]
+
+
+def closed_period(period):
+    """ Return the ClosedPeriod of a month, None if it is not closed """
+    if not is_closed(period):
+        return None
+    return ClosedPeriod.objects.filter(period=period).first()
+
+
+def aggregate_revenue_by_service(period):
+    return list(BillLine.objects
+            .filter(bills_of_months(period, period, 'bill__'))
+            .values('reference', 'name')
+            .annotate(line_count=Count('id'), quantity=Sum('quantity'),
+                billed=Sum('total'))
+            .order_by('reference', 'name'))
+
+
+def compute_revenue_by_service(period):
+    closed = closed_period(period)
+    if closed is None:
+        return aggregate_revenue_by_service(period)
+    return list(closed.services
+            .values('reference', 'name', 'line_count', 'quantity', 'billed')
+            .order_by('reference', 'name'))
+
+
+def revenue_by_service(period):
+    """ Return lines, quantity and amount billed by service in a month
+
+    Services are grouped as printed on invoices.
+    """
+    return cached_report('service', period, compute_revenue_by_service)
+
+
+def aggregate_revenue_by_coworker(period):
+    return list(Bill.objects.filter(bills_of_months(period, period))
+            .values('user_id', 'user__first_name', 'user__last_name')
+            .annotate(bill_count=Count('id'), billed=Sum('amount'),
+                unpaid=UNPAID)
+            .order_by('user__last_name', 'user__first_name', 'user_id'))
+
+
+def compute_revenue_by_coworker(period):
+    closed = closed_period(period)
+    if closed is None:
+        return aggregate_revenue_by_coworker(period)
+    return list(closed.coworkers
+            .values('user_id', 'user__first_name', 'user__last_name',
+                'bill_count', 'billed', 'unpaid')
+            .order_by('user__last_name', 'user__first_name', 'user_id'))
+
+
+def revenue_by_coworker(period):
+    """ Return bill count, billed and unpaid amounts by coworker in a month
+    """
+    return cached_report('coworker', period, compute_revenue_by_coworker)
+
+
+def compute_unpaid_aging(today):
+    aggregates = {}
+    for i, (label, newest, oldest) in enumerate(AGING_BUCKETS):
+        age = Q(billing_date__lte=today - datetime.timedelta(newest))
+        if oldest is not None:
+            age &= Q(billing_date__gte=today - datetime.timedelta(oldest))
+        aggregates['count_{}'.format(i)] = Sum(Case(
+            When(age, then=Value(1)), default=Value(0),
+            output_field=IntegerField()))
+        aggregates['unpaid_{}'.format(i)] = Sum(Case(
+            When(age, then='amount'), default=Value(0),
+            output_field=DecimalField()))
+    totals = Bill.objects.filter(isPaid=False).aggregate(**aggregates)
+    return [dict(label=label, bill_count=totals['count_{}'.format(i)] or 0,
+        unpaid=totals['unpaid_{}'.format(i)] or 0)
+        for i, (label, newest, oldest) in enumerate(AGING_BUCKETS)]
+
+
+def unpaid_aging(today=None):
+    """ Return count and amount of unpaid bills by age at a day """
+    today = today or datetime.date.today()
+    cache = get_reports_cache()
+    key = REPORT_KEY.format('aging', today.isoformat())
+    report = cache.get(key)
+    if report is None:
+        report = compute_unpaid_aging(today)
+        cache.set(key, report, BILLJOBS_REPORTS_CACHE_TIMEOUT)
+    return report
+
+
+def precompute_reports(first, last):
+    """ Compute and cache reports of closed months from first to last
+
+    Return the number of months computed.
+    """
+    periods = [period for period in month_periods(first, last)
+            if is_closed(period)]
+    if not periods:
+        return 0
+    get_reports_cache().delete_many([REPORT_KEY.format(name, period)
+        for period in periods for name in PERIOD_REPORTS])
+    revenue_by_month(periods[0], periods[-1])
+    for period in periods:
+        revenue_by_service(period)
+        revenue_by_coworker(period)
+    return len(periods)
+
+
+def close_period(period):
+    """ Write rollups of a closed month, its reports are then read from them
+
+    A month is closed once, return None when it already is. A change on one
+    of its bills, except a payment, drops the rollups: close it again.
+    """
+    try:
+        with transaction.atomic():
+            totals = compute_month_totals([period]).get(period, {})
+            closed = ClosedPeriod.objects.create(period=period, **totals)
+            ServiceRollup.objects.bulk_create(
+                    ServiceRollup(closed_period=closed, **row)
+                    for row in aggregate_revenue_by_service(period))
+            CoworkerRollup.objects.bulk_create(
+                    CoworkerRollup(closed_period=closed,
+                        user_id=row['user_id'],
+                        bill_count=row['bill_count'], billed=row['billed'],
+                        unpaid=row['unpaid'])
+                    for row in aggregate_revenue_by_coworker(period))
+    except IntegrityError:
+        if ClosedPeriod.objects.filter(period=period).exists():
+            return None
+        raise
+    return closed
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from django.db.models import Prefetch
+from rest_framework import serializers
+from .models import Bill, BillLine
+
+
+class BillLineSerializer(serializers.ModelSerializer):
+    """ Bill line with the service it bills, as it was billed """
+
+    class Meta:
+        model = BillLine
+        fields = ('id', 'service', 'reference', 'name', 'description',
+                'unit_price', 'quantity', 'total', 'note')
+        read_only_fields = fields
+
+
+class BillSerializer(serializers.ModelSerializer):
+    """ Bill with its lines, load them with BillSerializer.setup_queryset """
+    coworker = serializers.CharField(source='user.get_full_name')
+    lines = BillLineSerializer(source='billline_set', many=True)
+
+    class Meta:
+        model = Bill
+        fields = ('id', 'number', 'billing_date', 'user', 'coworker',
+                'amount', 'isPaid', 'issuer_address', 'billing_address',
+                'lines')
+        read_only_fields = fields
+
+    @staticmethod
+    def setup_queryset(queryset):
+        """ Load users and lines of bills in two queries """
+        return queryset.select_related('user').prefetch_related(
+                Prefetch('billline_set',
+                    queryset=BillLine.objects.order_by('id')))
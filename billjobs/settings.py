@@ -19,7 +19,22 @@ BILLJOBS_DEFAULT = dict(
             You can use htlm in this setting.
             """,
         FORCE_SUPERUSER=False,
-        FORCE_USER_GROUP=None
+        FORCE_USER_GROUP=None,
+        PDF_CACHE='default',
+        PDF_CACHE_TIMEOUT=None,
+        PDF_EXPORT_PROCESSES=0,
+        PDF_PRERENDER=False,
+        PDF_PRERENDER_PROCESSES=0,
+        PDF_RENDER_PROCESSES=0,
+        PDF_RENDER_QUEUE_SIZE=20,
+        PDF_RENDER_TIMEOUT=10,
+        PDF_RENDER_RETRY_AFTER=5,
+        REPORTS_CACHE='default',
+        REPORTS_CACHE_TIMEOUT=300,
+        REPORTS_CLOSED_CACHE_TIMEOUT=86400,
+        METRICS=False,
+        METRICS_SAMPLE_RATE=1.0,
+        METRICS_ALLOWED_IPS=('127.0.0.1', '::1')
         )
 
 
@@ -59,3 +74,78 @@ BILLJOBS_FORCE_USER_GROUP = getattr(
         'BILLJOBS_FORCE_USER_GROUP',
         BILLJOBS_DEFAULT['FORCE_USER_GROUP']
         )
+BILLJOBS_PDF_CACHE = getattr(
+        settings,
+        'BILLJOBS_PDF_CACHE',
+        BILLJOBS_DEFAULT['PDF_CACHE']
+        )
+BILLJOBS_PDF_CACHE_TIMEOUT = getattr(
+        settings,
+        'BILLJOBS_PDF_CACHE_TIMEOUT',
+        BILLJOBS_DEFAULT['PDF_CACHE_TIMEOUT']
+        )
+BILLJOBS_PDF_EXPORT_PROCESSES = getattr(
+        settings,
+        'BILLJOBS_PDF_EXPORT_PROCESSES',
+        BILLJOBS_DEFAULT['PDF_EXPORT_PROCESSES']
+        )
+BILLJOBS_PDF_PRERENDER = getattr(
+        settings,
+        'BILLJOBS_PDF_PRERENDER',
+        BILLJOBS_DEFAULT['PDF_PRERENDER']
+        )
+BILLJOBS_PDF_PRERENDER_PROCESSES = getattr(
+        settings,
+        'BILLJOBS_PDF_PRERENDER_PROCESSES',
+        BILLJOBS_DEFAULT['PDF_PRERENDER_PROCESSES']
+        )
+BILLJOBS_PDF_RENDER_PROCESSES = getattr(
+        settings,
+        'BILLJOBS_PDF_RENDER_PROCESSES',
+        BILLJOBS_DEFAULT['PDF_RENDER_PROCESSES']
+        )
+BILLJOBS_PDF_RENDER_QUEUE_SIZE = getattr(
+        settings,
+        'BILLJOBS_PDF_RENDER_QUEUE_SIZE',
+        BILLJOBS_DEFAULT['PDF_RENDER_QUEUE_SIZE']
+        )
+BILLJOBS_PDF_RENDER_TIMEOUT = getattr(
+        settings,
+        'BILLJOBS_PDF_RENDER_TIMEOUT',
+        BILLJOBS_DEFAULT['PDF_RENDER_TIMEOUT']
+        )
+BILLJOBS_PDF_RENDER_RETRY_AFTER = getattr(
+        settings,
+        'BILLJOBS_PDF_RENDER_RETRY_AFTER',
+        BILLJOBS_DEFAULT['PDF_RENDER_RETRY_AFTER']
+        )
+BILLJOBS_REPORTS_CACHE = getattr(
+        settings,
+        'BILLJOBS_REPORTS_CACHE',
+        BILLJOBS_DEFAULT['REPORTS_CACHE']
+        )
+BILLJOBS_REPORTS_CACHE_TIMEOUT = getattr(
+        settings,
+        'BILLJOBS_REPORTS_CACHE_TIMEOUT',
+        BILLJOBS_DEFAULT['REPORTS_CACHE_TIMEOUT']
+        )
+BILLJOBS_REPORTS_CLOSED_CACHE_TIMEOUT = getattr(
+        settings,
+        'BILLJOBS_REPORTS_CLOSED_CACHE_TIMEOUT',
+        BILLJOBS_DEFAULT['REPORTS_CLOSED_CACHE_TIMEOUT']
+        )
+BILLJOBS_METRICS = getattr(
+        settings,
+        'BILLJOBS_METRICS',
+        BILLJOBS_DEFAULT['METRICS']
+        )
+BILLJOBS_METRICS_SAMPLE_RATE = getattr(
+        settings,
+        'BILLJOBS_METRICS_SAMPLE_RATE',
+        BILLJOBS_DEFAULT['METRICS_SAMPLE_RATE']
+        )
+BILLJOBS_METRICS_ALLOWED_IPS = getattr(
+        settings,
+        'BILLJOBS_METRICS_ALLOWED_IPS',
+        BILLJOBS_DEFAULT['METRICS_ALLOWED_IPS']
+        )
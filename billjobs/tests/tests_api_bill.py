@@ -0,0 +1,92 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from billjobs.models import Bill, BillLine
+
+
+class BillAPITestCase(TestCase):
+    ''' Test read only bill API and its keyset pagination '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        self.admin = User.objects.get(username='bill')
+        self.user = User.objects.get(username='steve')
+        self.user.is_staff = False
+        self.user.save()
+        self.url = '/billjobs/api/1.0/bills/'
+        # bills of the same date are ordered by id
+        for i in range(3):
+            BillLine.objects.create(service_id=1,
+                    bill=Bill.objects.create(user=self.user))
+
+    def crawl(self, page_size):
+        ''' Return ids of bills of every page and count of pages '''
+        ids = []
+        url = '{}?page_size={}'.format(self.url, page_size)
+        pages = 0
+        while url:
+            data = self.client.get(url).json()
+            ids.extend(bill['id'] for bill in data['results'])
+            url = data['next']
+            pages += 1
+        return ids, pages
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_crawl_read_every_bill_once_in_order(self):
+        self.client.force_login(self.admin)
+        ids, pages = self.crawl(page_size=2)
+        self.assertEqual(ids, list(Bill.objects.order_by('billing_date', 'id')
+            .values_list('id', flat=True)))
+        self.assertEqual(pages, 4)
+
+    def test_bill_has_its_lines(self):
+        self.client.force_login(self.admin)
+        bill = self.client.get(self.url).json()['results'][0]
+        self.assertEqual(bill['number'], 'F201404001')
+        lines = BillLine.objects.filter(bill_id=bill['id']).order_by('id')
+        self.assertEqual([line['id'] for line in bill['lines']],
+                [line.id for line in lines])
+        self.assertEqual(bill['lines'][0]['reference'],
+                lines[0].service.reference)
+
+    def test_user_only_read_his_bills(self):
+        self.client.force_login(self.user)
+        ids, pages = self.crawl(page_size=100)
+        self.assertEqual(sorted(ids), sorted(
+            Bill.objects.filter(user=self.user).values_list('id', flat=True)))
+        other = Bill.objects.exclude(user=self.user).first()
+        response = self.client.get('{}{}/'.format(self.url, other.id))
+        self.assertEqual(response.status_code, 403)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url + '?page_size=1')
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(self.url + '?page_size=100')
+        self.assertEqual(len(small), len(large))
+
+    def test_if_none_match_return_not_modified(self):
+        self.client.force_login(self.admin)
+        url = '{}{}/'.format(self.url, Bill.objects.first().id)
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Bill.objects.filter(pk=Bill.objects.first().id).update(isPaid=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url + '?cursor=nope')
+        self.assertEqual(response.status_code, 404)
+
+    def test_bills_are_read_only(self):
+        self.client.force_login(self.admin)
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 403)
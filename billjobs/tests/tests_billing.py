@@ -0,0 +1,98 @@
+import datetime
+import io
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from billjobs.billing import generate_bills
+from billjobs.models import Bill, BillLine, BillingRun, ClosedPeriod, \
+        Service, Subscription, UserBillingSummary
+from billjobs.reports import close_period, revenue_by_month
+
+
+class GenerateBillsTestCase(TestCase):
+    ''' Test bills of subscriptions are generated once per period '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml']
+
+    def setUp(self):
+        full_time, mid_time = Service.objects.filter(pk__in=(1, 2)) \
+                .order_by('pk')
+        users = list(User.objects.order_by('pk'))
+        for user in users[:3]:
+            Subscription.objects.create(user=user, service=full_time)
+        Subscription.objects.create(user=users[0], service=mid_time,
+                quantity=2)
+        Subscription.objects.create(user=users[3], service=mid_time,
+                is_active=False)
+
+    def test_one_bill_per_subscribed_user(self):
+        run = generate_bills('2017-11', batch_size=2)
+        self.assertEqual(run.bill_count, 3)
+        self.assertEqual(Bill.objects.count(), 3)
+        self.assertEqual(BillLine.objects.count(), 4)
+        self.assertEqual(
+                len(set(Bill.objects.values_list('number', flat=True))), 3)
+        bill = Bill.objects.get(user__username='bill')
+        self.assertEqual(bill.amount, Decimal('380.00'))
+        self.assertEqual(bill.billing_address,
+                bill.user.userprofile.billing_address)
+        self.assertEqual(
+                list(bill.billline_set.values_list('total', 'note')),
+                [(Decimal('180.00'), '2017-11'), (Decimal('200.00'), '2017-11')])
+        line = bill.billline_set.order_by('pk').first()
+        self.assertEqual((line.reference, line.name, line.unit_price),
+                (line.service.reference, line.service.name, line.service.price))
+
+    def test_bills_are_dated_in_period(self):
+        generate_bills('2017-11')
+        self.assertEqual(set(Bill.objects.values_list('billing_date',
+            flat=True)), {datetime.date(2017, 11, 1)})
+        self.assertEqual(sorted(Bill.objects.values_list('number', flat=True)),
+                ['F201711001', 'F201711002', 'F201711003'])
+        self.assertEqual(revenue_by_month('2017-11', '2017-11')[0]
+                ['bill_count'], 3)
+        today = datetime.date.today()
+        generate_bills(today.strftime('%Y-%m'))
+        self.assertEqual(Bill.objects.filter(billing_date=today).count(), 3)
+
+    def test_closed_period_is_reopened(self):
+        close_period('2017-11')
+        generate_bills('2017-11')
+        self.assertFalse(ClosedPeriod.objects.exists())
+
+    def test_summaries_are_updated(self):
+        generate_bills('2017-11')
+        summary = UserBillingSummary.objects.get(user__username='bill')
+        self.assertEqual(summary.bill_count, 1)
+        self.assertEqual(summary.total_unpaid, Decimal('380.00'))
+
+    def test_queries_do_not_depend_on_subscriptions(self):
+        # bills of each period create its number sequence
+        generate_bills('2017-10')
+        with CaptureQueriesContext(connection) as few:
+            generate_bills('2017-11')
+        for user in User.objects.all():
+            Subscription.objects.create(user=user, service_id=3)
+        with CaptureQueriesContext(connection) as many:
+            generate_bills('2017-12')
+        self.assertEqual(Bill.objects.count(), 10)
+        self.assertEqual(len(few), len(many))
+
+    def test_period_is_generated_once(self):
+        self.assertIsNotNone(generate_bills('2017-11'))
+        self.assertIsNone(generate_bills('2017-11'))
+        self.assertEqual(Bill.objects.count(), 3)
+        self.assertEqual(BillingRun.objects.get().bill_count, 3)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('generate_bills', '--period=2017-1', stdout=out)
+        call_command('generate_bills', '--period=2017-01', stdout=out)
+        self.assertEqual(out.getvalue(), 'Created 3 bills for 2017-01\n'
+                'Bills of 2017-01 were already generated\n')
+        with self.assertRaises(CommandError):
+            call_command('generate_bills', '--period=January')
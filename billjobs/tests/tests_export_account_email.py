@@ -1,10 +1,12 @@
 import csv
 import io
+from unittest import mock
 from django.test import TestCase
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib.admin.sites import AdminSite
 from django.contrib.auth.models import User
 from billjobs.admin import UserAdmin
+from billjobs.export import emails_csv
 
 class MockRequest(object):
             pass
@@ -31,12 +33,12 @@ class EmailExportTestCase(TestCase):
         self.assertEqual(UserAdmin.export_email.short_description,
                 'Export email of selected users')
 
-    def test_action_return_http_response(self):
-        """ Test method return an HttpResponse """
+    def test_action_return_streaming_http_response(self):
+        """ Test method return a StreamingHttpResponse """
         user_admin = UserAdmin(User, self.site)
         response = user_admin.export_email(request=MockRequest(),
                 queryset=self.query_set)
-        self.assertIsInstance(response, HttpResponse)
+        self.assertIsInstance(response, StreamingHttpResponse)
 
     def test_action_return_csv(self):
         """ Test method return text/csv as http response content type """
@@ -54,4 +56,17 @@ class EmailExportTestCase(TestCase):
         writer = csv.writer(output)
         for email in User.objects.values_list('email'):
             writer.writerow(email)
-        self.assertEqual(response.content.decode(), output.getvalue())
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                output.getvalue())
+
+    def test_action_read_users_by_chunks(self):
+        """ Test emails are read by chunks in primary key order """
+        user_admin = UserAdmin(User, self.site)
+        with mock.patch('billjobs.admin.emails_csv',
+                lambda queryset: emails_csv(queryset, chunk_size=1)):
+            response = user_admin.export_email(request=MockRequest(),
+                    queryset=self.query_set)
+            with self.assertNumQueries(User.objects.count() + 1):
+                content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.split(), list(
+            User.objects.order_by('pk').values_list('email', flat=True)))
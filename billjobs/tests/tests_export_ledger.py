@@ -0,0 +1,66 @@
+import csv
+import io
+from django.test import TestCase
+from django.http import StreamingHttpResponse
+from django.contrib.admin.sites import AdminSite
+from billjobs.admin import BillAdmin
+from billjobs.export import ledger_csv
+from billjobs.models import Bill, BillLine
+
+
+class MockRequest(object):
+            pass
+
+
+class LedgerExportTestCase(TestCase):
+    """ Tests for bills accounting ledger export """
+
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        self.site = AdminSite()
+        self.query_set = Bill.objects.all()
+
+    def read_ledger(self, chunks):
+        return list(csv.reader(io.StringIO(''.join(chunks))))
+
+    def test_method_is_model_admin_action(self):
+        """ Test method is a custom action for bill admin """
+        self.assertTrue('export_ledger' in BillAdmin.actions)
+
+    def test_action_return_streaming_csv(self):
+        """ Test method return a streamed csv file """
+        bill_admin = BillAdmin(Bill, self.site)
+        response = bill_admin.export_ledger(request=MockRequest(),
+                queryset=bill_admin.get_queryset(MockRequest()))
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response.get('Content-Type'), 'text/csv')
+        rows = self.read_ledger(
+                chunk.decode() for chunk in response.streaming_content)
+        self.assertEqual(len(rows), BillLine.objects.count() + 1)
+
+    def test_ledger_has_one_row_per_line(self):
+        """ Test each line is exported with its bill, in bill order """
+        rows = self.read_ledger(ledger_csv(self.query_set, chunk_size=2))
+        lines = BillLine.objects.select_related('bill__user', 'service') \
+                .order_by('bill_id', 'pk')
+        self.assertEqual(rows[1:], [[
+            line.bill.number,
+            str(line.bill.billing_date),
+            line.bill.coworker_name(),
+            str(line.bill.amount),
+            str(line.bill.isPaid),
+            line.service.reference,
+            line.service.name,
+            str(line.quantity),
+            str(line.total),
+            line.note,
+            ] for line in lines])
+
+    def test_ledger_query_count_depends_on_chunks(self):
+        """ Test bills and their lines are read once per chunk """
+        bill_count = self.query_set.count()
+        with self.assertNumQueries(2 * bill_count + 1):
+            list(ledger_csv(self.query_set, chunk_size=1))
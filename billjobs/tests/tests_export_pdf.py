@@ -0,0 +1,67 @@
+import io
+import zipfile
+from unittest import mock
+from django.test import TestCase
+from django.http import StreamingHttpResponse
+from django.contrib.admin.sites import AdminSite
+from billjobs.admin import BillAdmin
+from billjobs.cache import get_pdf_cache
+from billjobs.export import bills_pdf_zip
+from billjobs.models import Bill
+from billjobs.pdf import render_invoice
+
+
+class MockRequest(object):
+            pass
+
+
+class PdfExportTestCase(TestCase):
+    """ Tests for invoices zip export """
+
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        get_pdf_cache().clear()
+        self.site = AdminSite()
+        self.query_set = Bill.objects.all()
+
+    def test_method_is_model_admin_action(self):
+        """ Test method is a custom action for bill admin """
+        self.assertTrue('export_pdf' in BillAdmin.actions)
+
+    def test_action_return_streaming_zip(self):
+        """ Test method return a streamed zip archive """
+        bill_admin = BillAdmin(Bill, self.site)
+        response = bill_admin.export_pdf(request=MockRequest(),
+                queryset=self.query_set)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(response.get('Content-Type'), 'application/zip')
+
+    def test_archive_contains_one_pdf_per_bill(self):
+        """ Test archive contains a pdf named with each bill number """
+        content = b''.join(bills_pdf_zip(self.query_set, chunk_size=2))
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertEqual(
+                sorted(archive.namelist()),
+                sorted('{}.pdf'.format(n) for n in
+                    self.query_set.values_list('number', flat=True)))
+        for name in archive.namelist():
+            self.assertTrue(archive.read(name).startswith(b'%PDF'))
+
+    def test_archive_with_process_pool(self):
+        """ Test pdf rendered by worker processes are in the archive """
+        content = b''.join(bills_pdf_zip(self.query_set, processes=2))
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertEqual(len(archive.namelist()), self.query_set.count())
+
+    def test_pdf_is_sent_once_rendered(self):
+        """ Test each pdf is sent without waiting for the rest of its chunk """
+        with mock.patch('billjobs.export.render_invoice',
+                wraps=render_invoice) as render:
+            stream = bills_pdf_zip(self.query_set, chunk_size=50)
+            self.assertTrue(next(stream))
+            self.assertEqual(render.call_count, 1)
+            b''.join(stream)
+        self.assertEqual(render.call_count, self.query_set.count())
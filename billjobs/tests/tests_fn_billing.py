@@ -1,5 +1,8 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from billjobs.models import Bill, BillLine, Service
 
 
 class BillingAdminListViewTestCase(TestCase):
@@ -14,3 +17,82 @@ class BillingAdminListViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response,
                 '<td class="field-coworker_name_link"><a href="/admin/auth/user/1/change/">Bill Jobs</a></td>')
+
+    def test_list_view_query_count_does_not_depend_on_bills(self):
+        ''' Test BillAdmin list view does not query each bill user '''
+        admin = User.objects.get(pk=1)
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as one_bill:
+            self.client.get('/admin/billjobs/bill/')
+        for i in range(20):
+            Bill.objects.create(user=admin)
+        with CaptureQueriesContext(connection) as many_bills:
+            response = self.client.get('/admin/billjobs/bill/')
+        self.assertContains(response, 'field-coworker_name_link', count=21)
+        self.assertEqual(len(one_bill), len(many_bills))
+
+
+class BillingAdminChangeViewTestCase(TestCase):
+    ''' Test bill lines inline in BillAdmin change view '''
+    fixtures = ['test_billing_admin.yaml', 'dev_model_030_service.yaml']
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(pk=1))
+        self.bill = Bill.objects.get(pk=1)
+        self.url = '/admin/billjobs/bill/1/change/'
+
+    def add_lines(self, count, service_id=1):
+        for i in range(count):
+            BillLine.objects.create(bill=self.bill, service_id=service_id)
+
+    def test_query_count_does_not_depend_on_lines(self):
+        ''' Test services are not queried for each inline form '''
+        self.add_lines(1)
+        # fill caches
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as one_line:
+            self.client.get(self.url)
+        self.add_lines(10)
+        with CaptureQueriesContext(connection) as many_lines:
+            response = self.client.get(self.url)
+        self.assertContains(
+                response, '<option value="3">Meeting 1 day</option>', count=13)
+        self.assertEqual(len(one_line), len(many_lines))
+
+    def test_unavailable_service_only_in_its_lines(self):
+        ''' Test an unavailable service is only proposed for its own line '''
+        self.add_lines(1)
+        # as another process would, without signals
+        Service.objects.filter(pk=2).update(is_available=False)
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'Mid Time</option>')
+        self.add_lines(1, service_id=2)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Mid Time</option>', count=1)
+        Service.objects.filter(pk=2).update(is_available=True)
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Mid Time</option>', count=4)
+
+
+class UserAdminListViewTestCase(TestCase):
+    ''' Test user model admin view shows billing summary '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(username='bill'))
+
+    def test_sort_by_outstanding_balance(self):
+        ''' Test users are sorted by summary, without aggregating bills '''
+        with CaptureQueriesContext(connection) as queries:
+            # sort by descending total_unpaid column
+            response = self.client.get('/admin/auth/user/?o=-6')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries
+            if 'GROUP BY' in query['sql'] or 'billjobs_bill"' in query['sql']])
+        self.assertEqual(
+                [user.pk for user in response.context['cl'].result_list],
+                list(User.objects.order_by(
+                    '-billing_summary__total_unpaid', '-pk')
+                    .values_list('pk', flat=True)))
@@ -0,0 +1,54 @@
+import re
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are read on SQLite')
+class QueryPlanTestCase(TestCase):
+    ''' Test admin filters on bills and services are backed by an index '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        self.client.force_login(User.objects.get(username='bill'))
+
+    def full_scans(self, url, table):
+        ''' Return filtered queries of url reading every row of table '''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        scans = []
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or ' WHERE ' not in sql \
+                    or '"{}"'.format(table) not in sql:
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+            # SCAN without index reads the whole table
+            if any(re.match(r'SCAN (TABLE )?{}( AS \w+)?$'.format(table),
+                detail) for detail in plan):
+                scans.append((sql, plan))
+        return scans
+
+    def test_unpaid_bills_filter(self):
+        self.assertEqual(self.full_scans(
+            '/admin/billjobs/bill/?isPaid__exact=0', 'billjobs_bill'), [])
+
+    def test_paid_bills_filter(self):
+        self.assertEqual(self.full_scans(
+            '/admin/billjobs/bill/?isPaid__exact=1', 'billjobs_bill'), [])
+
+    def test_available_services_filter(self):
+        self.assertEqual(self.full_scans(
+            '/admin/billjobs/service/?is_available__exact=1',
+            'billjobs_service'), [])
+
+    def test_bill_line_service_choices(self):
+        self.assertEqual(self.full_scans(
+            '/admin/billjobs/bill/add/', 'billjobs_service'), [])
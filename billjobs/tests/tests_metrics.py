@@ -0,0 +1,90 @@
+import importlib
+import json
+from unittest import mock
+from django.conf import settings
+from django.conf.urls import include, url
+from django.test import TestCase, override_settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from billjobs import urls, views
+from billjobs.cache import get_pdf_cache
+from billjobs.metrics import registry
+
+MIDDLEWARE_CLASSES = settings.MIDDLEWARE_CLASSES + (
+        'billjobs.metrics.MetricsMiddleware',)
+
+# urls of a project with BILLJOBS_METRICS enabled
+urlpatterns = [
+        url(r'^billjobs/metrics$', views.metrics, name='billjobs_metrics'),
+        url(r'^billjobs/', include('billjobs.urls')),
+        url(r'^admin/', include(admin.site.urls)),
+        ]
+
+
+@override_settings(MIDDLEWARE_CLASSES=MIDDLEWARE_CLASSES,
+        ROOT_URLCONF=__name__)
+class MetricsMiddlewareTestCase(TestCase):
+    ''' Test sampled requests are measured and exposed '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        get_pdf_cache().clear()
+        registry.clear()
+        self.client.force_login(User.objects.get(username='bill'))
+
+    def test_pdf_request_is_logged(self):
+        with self.assertLogs('billjobs.metrics', 'INFO') as logs:
+            response = self.client.get('/billjobs/generate_pdf/1')
+        stats = json.loads(logs.records[0].getMessage())
+        self.assertEqual(stats['view'], 'generate-pdf')
+        self.assertEqual(stats['status'], 200)
+        self.assertGreater(stats['queries'], 0)
+        self.assertGreater(stats['pdf_ms'], 0)
+        self.assertEqual(stats['response_bytes'], len(response.content))
+
+    def test_streamed_response_is_measured_until_the_end(self):
+        with self.assertLogs('billjobs.metrics', 'INFO') as logs:
+            response = self.client.post('/admin/auth/user/', {
+                'action': 'export_email',
+                '_selected_action': User.objects.values_list('pk', flat=True),
+                })
+            # nothing is recorded until the content is sent
+            self.assertFalse(registry.as_prometheus().count('changelist'))
+            content = b''.join(response.streaming_content)
+        stats = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(stats['view'], 'admin:auth_user_changelist')
+        self.assertEqual(stats['response_bytes'], len(content))
+        self.assertGreater(stats['queries'], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/billjobs/generate_pdf/1')
+        self.client.get('/billjobs/generate_pdf/1')
+        response = self.client.get('/billjobs/metrics')
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('# TYPE billjobs_sql_queries_total counter', content)
+        self.assertIn('billjobs_requests_total{view="generate-pdf"} 2',
+                content)
+
+    def test_metrics_endpoint_is_local(self):
+        response = self.client.get('/billjobs/metrics',
+                REMOTE_ADDR='192.0.2.1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_metrics_url_is_opt_in(self):
+        self.assertNotIn('billjobs_metrics',
+                [pattern.name for pattern in urls.urlpatterns])
+        try:
+            with mock.patch('billjobs.settings.BILLJOBS_METRICS', True):
+                importlib.reload(urls)
+            self.assertIn('billjobs_metrics',
+                    [pattern.name for pattern in urls.urlpatterns])
+        finally:
+            importlib.reload(urls)
+
+    @mock.patch('billjobs.metrics.BILLJOBS_METRICS_SAMPLE_RATE', 0)
+    def test_request_is_not_sampled(self):
+        self.client.get('/billjobs/generate_pdf/1')
+        self.assertNotIn('generate-pdf', registry.as_prometheus())
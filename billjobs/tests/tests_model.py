@@ -1,7 +1,15 @@
+import datetime
+import io
+from decimal import Decimal
+from django.core import serializers
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.db.utils import IntegrityError
-from billjobs.models import Bill, Service
+from billjobs.models import Bill, BillLine, BillNumberSequence, Service, \
+        UserBillingSummary, reserve_bill_numbers, defer_bill_amount
 from billjobs.settings import BILLJOBS_BILL_ISSUER
 
 
@@ -53,6 +61,294 @@ class BillingTestCase(TestCase):
         bill.save()
         self.assertEqual(bill.billing_address, previous_billing_address)
 
+    def count_save_queries(self, bill):
+        with CaptureQueriesContext(connection) as queries:
+            bill.save()
+        return len(queries)
+
+    def test_billing_address_read_with_one_query(self):
+        self.count_save_queries(Bill(user=self.user))
+        known = self.count_save_queries(
+                Bill(user_id=self.user.id, billing_address='Paris'))
+        bill = Bill(user_id=self.user.id)
+        self.assertEqual(self.count_save_queries(bill), known + 1)
+        self.assertEqual(
+                bill.billing_address, self.user.userprofile.billing_address)
+
+    def test_loaded_profile_is_reused(self):
+        user = User.objects.select_related('userprofile').get(pk=self.user.pk)
+        self.count_save_queries(Bill(user=user))
+        known = self.count_save_queries(
+                Bill(user=user, billing_address='Paris'))
+        self.assertEqual(self.count_save_queries(Bill(user=user)), known)
+
+    def test_bulk_create_for_users(self):
+        users = list(User.objects.order_by('pk'))
+        with CaptureQueriesContext(connection) as queries:
+            bills = Bill.objects.bulk_create_for_users(
+                    [users[0], users[1].id, users[0]])
+        # addresses of every user are read at once
+        self.assertEqual(len([query for query in queries
+            if 'userprofile' in query['sql'] or 'auth_user' in query['sql']]),
+            1)
+        self.assertEqual([bill.user_id for bill in bills],
+                [users[0].id, users[1].id, users[0].id])
+        for bill in bills:
+            saved = Bill.objects.get(pk=bill.pk)
+            self.assertEqual(saved.number, bill.number)
+            self.assertEqual(saved.billing_address,
+                    saved.user.userprofile.billing_address)
+        self.assertEqual(len(set(bill.number for bill in bills)), 3)
+
+
+class BillNumberTestCase(TestCase):
+    ''' Test bill number allocation '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml']
+
+    def setUp(self):
+        self.user = User.objects.get(username='bill')
+        self.period = datetime.date.today().strftime('%Y%m')
+
+    def test_bill_numbers_are_incremental(self):
+        first = Bill.objects.create(user=self.user)
+        second = Bill.objects.create(user=self.user)
+        self.assertEqual(first.number, 'F%s001' % self.period)
+        self.assertEqual(second.number, 'F%s002' % self.period)
+
+    def test_bill_number_restart_every_month(self):
+        self.assertEqual(
+                reserve_bill_numbers(date=datetime.date(2017, 1, 31)),
+                ['F201701001'])
+        self.assertEqual(
+                reserve_bill_numbers(date=datetime.date(2017, 2, 1)),
+                ['F201702001'])
+
+    def test_reserve_many_bill_numbers(self):
+        reserve_bill_numbers(date=datetime.date(2017, 1, 1))
+        self.assertEqual(
+                reserve_bill_numbers(3, date=datetime.date(2017, 1, 1)),
+                ['F201701002', 'F201701003', 'F201701004'])
+
+    def test_bill_number_after_999(self):
+        BillNumberSequence.objects.create(period='201701', last_value=999)
+        self.assertEqual(
+                reserve_bill_numbers(date=datetime.date(2017, 1, 1)),
+                ['F2017011000'])
+
+
+class BillAmountTestCase(TestCase):
+    ''' Test bill amount is computed from its lines '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml']
+
+    def setUp(self):
+        self.bill = Bill.objects.create(user=User.objects.get(username='bill'))
+        self.service = Service.objects.get(pk=1)
+
+    def add_line(self, quantity=1):
+        return BillLine.objects.create(
+                bill=self.bill, service=self.service, quantity=quantity)
+
+    def test_amount_follow_lines(self):
+        self.add_line()
+        line = self.add_line(2)
+        self.assertEqual(self.bill.amount, 3 * self.service.price)
+        line.delete()
+        self.assertEqual(self.bill.amount, self.service.price)
+        self.assertEqual(
+                Bill.objects.get(pk=self.bill.pk).amount, self.service.price)
+
+    def test_amount_is_exact(self):
+        self.service.price = Decimal('0.10')
+        self.service.save()
+        for i in range(3):
+            self.add_line()
+        self.assertEqual(
+                Bill.objects.get(pk=self.bill.pk).amount, Decimal('0.30'))
+
+    def test_deferred_amount_is_computed_once(self):
+        with defer_bill_amount():
+            # one insert per line, amount is not computed
+            with self.assertNumQueries(3):
+                for i in range(3):
+                    self.add_line()
+            self.assertEqual(self.bill.amount, 0)
+        self.assertEqual(self.bill.amount, 3 * self.service.price)
+        self.assertEqual(
+                Bill.objects.get(pk=self.bill.pk).amount,
+                3 * self.service.price)
+
+    def test_nested_deferred_amount(self):
+        with defer_bill_amount():
+            with defer_bill_amount():
+                self.add_line()
+            self.assertEqual(self.bill.amount, 0)
+        self.assertEqual(self.bill.amount, self.service.price)
+
+
+class BillingSummaryTestCase(TestCase):
+    ''' Test billing summary of users follow their bills '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        self.user = User.objects.get(username='bill')
+        self.service = Service.objects.get(pk=1)
+
+    def assertSummaryIsRebuilt(self):
+        """ Summaries updated by difference equal summaries from scratch """
+        fields = ('user_id', 'bill_count', 'total_billed', 'total_unpaid',
+                'last_billing_date')
+        summaries = list(UserBillingSummary.objects.order_by('user_id')
+                .values_list(*fields))
+        call_command('rebuild_billing_summary', batch_size=2,
+                stdout=io.StringIO())
+        self.assertEqual(summaries, list(UserBillingSummary.objects
+            .order_by('user_id').values_list(*fields)))
+
+    def test_summary_follow_bills(self):
+        bill = Bill.objects.create(user=self.user)
+        BillLine.objects.create(bill=bill, service=self.service, quantity=2)
+        summary = UserBillingSummary.objects.get(user=self.user)
+        self.assertEqual(summary.last_billing_date, bill.billing_date)
+        self.assertSummaryIsRebuilt()
+
+        bill.isPaid = True
+        bill.save()
+        self.assertSummaryIsRebuilt()
+        bill.user = User.objects.exclude(pk=self.user.pk).first()
+        bill.save()
+        self.assertSummaryIsRebuilt()
+        bill.delete()
+        self.assertSummaryIsRebuilt()
+
+    def test_summary_follow_lines(self):
+        bill = Bill.objects.filter(user=self.user).first()
+        line = bill.billline_set.first()
+        line.quantity += 3
+        line.total = None
+        line.save()
+        self.assertSummaryIsRebuilt()
+        with defer_bill_amount():
+            for i in range(3):
+                BillLine.objects.create(bill=bill, service=self.service)
+        self.assertSummaryIsRebuilt()
+        line.delete()
+        self.assertSummaryIsRebuilt()
+
+    def test_missing_summary_is_rebuilt(self):
+        UserBillingSummary.objects.filter(user=self.user).delete()
+        bill = Bill.objects.create(user=self.user)
+        BillLine.objects.create(bill=bill, service=self.service)
+        self.assertSummaryIsRebuilt()
+
+    def test_summary_is_updated_by_difference(self):
+        bill = Bill.objects.filter(user=self.user).first()
+        # store billing address of the profile
+        bill.save()
+        bill.isPaid = not bill.isPaid
+        # lock bill, bill amount, update bill, update closed period, update
+        # summary
+        with self.assertNumQueries(5):
+            bill.save()
+
+    def test_stale_bill_is_counted_as_saved(self):
+        bill = Bill.objects.create(user=self.user)
+        BillLine.objects.create(bill=bill, service=self.service)
+        stale = Bill.objects.get(pk=bill.pk)
+        BillLine.objects.create(bill=Bill.objects.get(pk=bill.pk),
+                service=self.service)
+        stale.isPaid = True
+        stale.save()
+        self.assertSummaryIsRebuilt()
+        stale.delete()
+        self.assertSummaryIsRebuilt()
+
+    def test_stale_bill_of_line_is_counted_as_saved(self):
+        bill = Bill.objects.create(user=self.user)
+        line = BillLine.objects.create(bill=bill, service=self.service)
+        paid = Bill.objects.get(pk=bill.pk)
+        paid.isPaid = True
+        paid.save()
+        # the line still holds the unpaid bill
+        line.quantity = 2
+        line.save()
+        self.assertSummaryIsRebuilt()
+
+    def test_bill_paid_twice_is_counted_once(self):
+        first = Bill.objects.filter(user=self.user, isPaid=False).first()
+        second = Bill.objects.get(pk=first.pk)
+        for bill in (first, second):
+            bill.isPaid = True
+            bill.save()
+        self.assertSummaryIsRebuilt()
+        self.assertGreaterEqual(UserBillingSummary.objects.get(
+            user=self.user).total_unpaid, 0)
+
+    def test_summary_follow_update_fields(self):
+        bill = Bill.objects.filter(user=self.user).first()
+        bill.isPaid = not bill.isPaid
+        bill.user = User.objects.exclude(pk=self.user.pk).first()
+        bill.save(update_fields=['isPaid'])
+        self.assertSummaryIsRebuilt()
+
+    def test_delete_user(self):
+        self.user.delete()
+        self.assertFalse(UserBillingSummary.objects.filter(
+            user_id=self.user.pk).exists())
+        self.assertSummaryIsRebuilt()
+
+
+class BillLineSnapshotTestCase(TestCase):
+    ''' Test bill lines keep service as it was billed '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml']
+
+    def setUp(self):
+        self.bill = Bill.objects.create(user=User.objects.get(username='bill'))
+        self.line = BillLine.objects.create(bill=self.bill, service_id=1)
+
+    def test_service_is_copied_at_creation(self):
+        service = Service.objects.get(pk=1)
+        line = BillLine.objects.get(pk=self.line.pk)
+        self.assertEqual(
+                (line.reference, line.name, line.description, line.unit_price),
+                (service.reference, service.name, service.description,
+                    service.price))
+
+    def test_service_change_keep_line(self):
+        Service.objects.filter(pk=1).update(name='Renamed', price=1)
+        line = BillLine.objects.get(pk=self.line.pk)
+        line.quantity = 2
+        line.save()
+        line = BillLine.objects.get(pk=self.line.pk)
+        self.assertNotEqual(line.name, 'Renamed')
+        self.assertNotEqual(line.unit_price, 1)
+
+    def test_new_service_of_line_is_copied(self):
+        line = BillLine.objects.get(pk=self.line.pk)
+        line.service = Service.objects.get(pk=2)
+        line.save()
+        self.assertEqual(BillLine.objects.get(pk=self.line.pk).name,
+                Service.objects.get(pk=2).name)
+
+    def test_loaded_line_keeps_its_snapshot(self):
+        line = BillLine.objects.get(pk=self.line.pk)
+        line.quantity = 2
+        line.total = 20
+        line.save()
+        BillLine.objects.filter(pk=line.pk).update(unit_price=10)
+        dump = serializers.serialize('json',
+                BillLine.objects.filter(pk=line.pk))
+        Service.objects.filter(pk=1).update(name='New', price=99)
+        BillLine.objects.filter(pk=line.pk).delete()
+        for obj in serializers.deserialize('json', dump):
+            obj.save()
+        loaded = BillLine.objects.get(pk=line.pk)
+        self.assertEqual((loaded.name, loaded.unit_price, loaded.total),
+                (line.name, 10, 20))
+
 
 class ServiceTestCase(TestCase):
     ''' Test CRUD for Service model '''
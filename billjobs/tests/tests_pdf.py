@@ -0,0 +1,63 @@
+import pickle
+import re
+from django.test import TestCase
+from django.contrib.auth.models import User
+from billjobs.invoice import Invoice
+from billjobs.models import Bill, BillLine, Service
+from billjobs.pdf import render_bill, render_invoice
+
+
+class PdfRenderTestCase(TestCase):
+    ''' Test invoice rendering '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml']
+
+    def setUp(self):
+        self.bill = Bill.objects.create(user=User.objects.get(username='bill'))
+        self.service = Service.objects.get(pk=1)
+
+    def count_pages(self, lines):
+        BillLine.objects.bulk_create(
+                BillLine(bill=self.bill, service=self.service,
+                    unit_price=1, total=1)
+                for i in range(lines))
+        content = render_bill(Bill.objects.get(pk=self.bill.pk))
+        self.assertTrue(content.startswith(b'%PDF'))
+        return len(re.findall(rb'/Type /Page\b(?!s)', content))
+
+    def test_small_bill_on_one_page(self):
+        self.assertEqual(self.count_pages(3), 1)
+
+    def test_bill_lines_are_split_on_many_pages(self):
+        self.assertGreater(self.count_pages(100), 2)
+
+
+class InvoiceTestCase(TestCase):
+    ''' Test invoice snapshot is read at once and rendered alone '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def test_invoice_is_loaded_with_two_queries(self):
+        with self.assertNumQueries(2):
+            invoice = Invoice.load(1)
+        bill = Bill.objects.get(pk=1)
+        self.assertEqual(invoice.number, bill.number)
+        self.assertEqual(invoice.customer_name, bill.coworker_name())
+        self.assertEqual([line.total for line in invoice.lines],
+                [line.total for line in bill.billline_set.order_by('id')])
+
+    def test_invoice_is_rendered_without_database(self):
+        invoice = Invoice.load(1)
+        with self.assertNumQueries(0):
+            content = render_invoice(invoice)
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_invoice_is_immutable_and_picklable(self):
+        invoice = Invoice.load(1)
+        with self.assertRaises(AttributeError):
+            invoice.amount = 0
+        with self.assertRaises(AttributeError):
+            invoice.lines[0].total = 0
+        self.assertEqual(pickle.loads(pickle.dumps(invoice)), invoice)
+        self.assertEqual(hash(Invoice.load(1)), hash(invoice))
@@ -0,0 +1,67 @@
+from unittest import mock
+from django.test import TestCase
+from django.contrib.auth.models import User
+from billjobs.cache import get_pdf_cache, BILL_PDF_KEY
+from billjobs.models import Bill, BillLine, Service
+from billjobs.pdf import render_invoice
+
+
+class PdfCacheTestCase(TestCase):
+    ''' Test pdf download is rendered once and revalidated with ETag '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        get_pdf_cache().clear()
+        self.client.force_login(User.objects.get(username='bill'))
+        self.url = '/billjobs/generate_pdf/1'
+
+    def test_pdf_is_rendered_once(self):
+        with mock.patch('billjobs.cache.render_invoice',
+                wraps=render_invoice) as render:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+
+    def test_if_none_match_return_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_does_not_read_or_render_pdf(self):
+        etag = self.client.get(self.url)['ETag']
+        get_pdf_cache().clear()
+        with mock.patch('billjobs.views.get_invoice_pdf') as get_pdf:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        get_pdf.assert_not_called()
+
+    def test_reports_cache_does_not_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch('billjobs.cache.BILLJOBS_REPORTS_CACHE', 'reports'):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_bill_line_change_invalidate_pdf(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertIsNotNone(get_pdf_cache().get(BILL_PDF_KEY.format(1)))
+        line = BillLine.objects.filter(bill_id=1).first()
+        line.quantity = 5
+        line.total = None
+        line.save()
+        self.assertIsNone(get_pdf_cache().get(BILL_PDF_KEY.format(1)))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_service_change_keep_issued_invoice(self):
+        ''' Lines keep service as it was billed, invoice does not change '''
+        etag = self.client.get(self.url)['ETag']
+        Service.objects.filter(pk=1).update(name='Renamed', price=1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
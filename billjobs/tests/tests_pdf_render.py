@@ -0,0 +1,79 @@
+import threading
+from unittest import mock
+from django.test import TestCase
+from django.contrib.auth.models import User
+from billjobs import render
+from billjobs.cache import get_pdf_cache
+from billjobs.metrics import registry
+from billjobs.invoice import Invoice
+from billjobs.pdf import render_invoice
+from billjobs.render import PdfRenderBusy, get_render_pool, render_in_pool
+
+
+@mock.patch('billjobs.render.BILLJOBS_PDF_RENDER_PROCESSES', 1)
+class RenderPoolTestCase(TestCase):
+    ''' Test invoices rendered by a bounded pool of processes '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        get_pdf_cache().clear()
+        registry.clear()
+        self.client.force_login(User.objects.get(username='bill'))
+        self.url = '/billjobs/generate_pdf/1'
+
+    def tearDown(self):
+        if render._pool is not None:
+            render.reset_render_pool(render._pool)
+
+
+    def test_pdf_is_rendered_by_pool(self):
+        with mock.patch('billjobs.cache.render_invoice') as render_here:
+            response = self.client.get(self.url)
+        self.assertFalse(render_here.called)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        self.assertEqual(get_render_pool().depth, 0)
+
+    def test_full_queue_answer_service_unavailable(self):
+        pool = get_render_pool()
+        pool.depth = pool.size
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertIn('billjobs_pdf_render_rejected_total 1',
+                registry.as_prometheus())
+        pool.depth = 0
+
+    def test_late_pdf_is_given_to_callback(self):
+        rendered = threading.Event()
+        with self.assertRaises(PdfRenderBusy):
+            render_in_pool(Invoice.load(1), 0,
+                    lambda content: rendered.set())
+        self.assertTrue(rendered.wait(30))
+        self.assertIn('billjobs_pdf_render_timeouts_total 1',
+                registry.as_prometheus())
+
+    @mock.patch('billjobs.cache.BILLJOBS_PDF_RENDER_TIMEOUT', 0)
+    def test_late_pdf_is_cached(self):
+        cached = threading.Event()
+        with mock.patch('billjobs.cache.set_cached_pdf',
+                side_effect=lambda *args: cached.set()):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(cached.wait(30))
+
+    def test_queue_depth_metric(self):
+        self.assertIn('billjobs_pdf_render_queue_depth 0',
+                registry.as_prometheus())
+        pool = get_render_pool()
+        pool.depth = 3
+        self.assertIn('billjobs_pdf_render_queue_depth 3',
+                registry.as_prometheus())
+        pool.depth = 0
+
+    def test_payload_render_same_invoice(self):
+        invoice = Invoice.load(1)
+        future = get_render_pool().submit(invoice)
+        self.assertEqual(len(future.result(30)), len(render_invoice(invoice)))
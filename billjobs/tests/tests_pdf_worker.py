@@ -0,0 +1,111 @@
+from unittest import mock
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils import timezone
+from billjobs.cache import get_pdf_cache, get_invoice_pdf, BILL_PDF_KEY
+from billjobs.invoice import Invoice
+from billjobs.models import Bill, BillLine, PdfRenderJob, defer_bill_amount
+from billjobs.pdf import render_invoice
+from io import StringIO
+import datetime
+
+
+@mock.patch('billjobs.models.BILLJOBS_PDF_PRERENDER', True)
+class PdfRenderWorkerTestCase(TestCase):
+    ''' Test changed bills are queued and rendered by the worker '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        get_pdf_cache().clear()
+        PdfRenderJob.objects.all().delete()
+
+    def test_bill_change_enqueue_one_job(self):
+        bill = Bill.objects.get(pk=1)
+        bill.save()
+        bill.save()
+        self.assertEqual(
+                list(PdfRenderJob.objects.values_list('bill_id', flat=True)),
+                [1])
+
+    def test_deferred_lines_enqueue_once(self):
+        lines = list(BillLine.objects.filter(bill_id=1))
+        with defer_bill_amount():
+            for line in lines:
+                line.save()
+        self.assertEqual(PdfRenderJob.objects.count(), 1)
+
+    def test_deleted_bill_is_not_enqueued(self):
+        Bill.objects.get(pk=1).delete()
+        self.assertFalse(PdfRenderJob.objects.exists())
+
+    def test_claimed_job_is_not_claimed_again(self):
+        PdfRenderJob.objects.enqueue(1)
+        PdfRenderJob.objects.enqueue(2)
+        first = PdfRenderJob.objects.claim(batch_size=1)
+        second = PdfRenderJob.objects.claim(batch_size=10)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].bill_id, second[0].bill_id)
+        self.assertEqual(PdfRenderJob.objects.claim(), [])
+
+    def test_expired_job_is_claimed_again(self):
+        PdfRenderJob.objects.enqueue(1)
+        PdfRenderJob.objects.claim()
+        PdfRenderJob.objects.update(
+                locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(len(PdfRenderJob.objects.claim()), 1)
+
+    def test_job_changed_while_rendered_is_kept(self):
+        PdfRenderJob.objects.enqueue(1)
+        job = PdfRenderJob.objects.claim()[0]
+        PdfRenderJob.objects.enqueue(1)
+        PdfRenderJob.objects.complete(job)
+        self.assertEqual(PdfRenderJob.objects.count(), 1)
+
+    def run_worker(self, **options):
+        stderr = StringIO()
+        with mock.patch('billjobs.management.commands.render_pdf_worker'
+                '.is_shared_cache', return_value=True):
+            call_command('render_pdf_worker', once=True, stdout=StringIO(),
+                    stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_worker_needs_shared_cache(self):
+        # tests use the local memory cache of their own process
+        with self.assertRaisesRegex(CommandError, 'BILLJOBS_PDF_CACHE'):
+            call_command('render_pdf_worker', once=True, stdout=StringIO())
+
+    def test_failed_bill_does_not_stop_worker(self):
+        def render(invoice):
+            if invoice.bill_id == 1:
+                raise ValueError('broken invoice')
+            return render_invoice(invoice)
+
+        PdfRenderJob.objects.enqueue(1)
+        PdfRenderJob.objects.enqueue(2)
+        with mock.patch('billjobs.export.render_invoice', render):
+            errors = self.run_worker()
+        self.assertIn('Failed to render bill 1', errors)
+        self.assertEqual(
+                list(PdfRenderJob.objects.values_list('bill_id', flat=True)),
+                [1])
+        self.assertIsNotNone(get_pdf_cache().get(BILL_PDF_KEY.format(2)))
+
+    def test_abandoned_job_is_dropped(self):
+        PdfRenderJob.objects.enqueue(1)
+        PdfRenderJob.objects.update(attempts=3,
+                locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertIn('Gave up rendering bill 1', self.run_worker())
+        self.assertFalse(PdfRenderJob.objects.exists())
+
+    def test_worker_render_queued_bills(self):
+        PdfRenderJob.objects.enqueue(1)
+        self.run_worker()
+        self.assertFalse(PdfRenderJob.objects.exists())
+        self.assertIsNotNone(get_pdf_cache().get(BILL_PDF_KEY.format(1)))
+        with mock.patch('billjobs.cache.render_invoice') as render:
+            get_invoice_pdf(Invoice.load(1))
+        self.assertFalse(render.called)
@@ -0,0 +1,63 @@
+from django.contrib.auth.models import AnonymousUser, Group, User
+from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from billjobs.permissions import CustomBillAPIPermission, \
+        CustomGroupDetailAPIPermission, CustomUserAPIPermission
+
+
+class PermissionTestCase(TestCase):
+    ''' Test permission classes read user groups once by request '''
+    fixtures = ['dev_model_010_user.yaml']
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = User.objects.get(username='steve')
+        self.user.is_staff = False
+        self.user.save()
+        self.groups = [Group.objects.create(name='group {}'.format(i))
+                for i in range(5)]
+        self.user.groups.add(*self.groups[:2])
+
+    def request(self, user, method='get'):
+        request = Request(getattr(self.factory, method)('/'))
+        request.user = user
+        return request
+
+    def test_group_detail_read_groups_once(self):
+        request = self.request(self.user)
+        permission = CustomGroupDetailAPIPermission()
+        with self.assertNumQueries(1):
+            allowed = [permission.has_object_permission(request, None, group)
+                    for group in self.groups]
+        self.assertEqual(allowed, [True, True, False, False, False])
+
+    def test_group_detail_update_is_for_admin(self):
+        request = self.request(self.user, 'put')
+        permission = CustomGroupDetailAPIPermission()
+        self.assertFalse(
+                permission.has_object_permission(request, None, self.groups[0]))
+        request = self.request(User.objects.get(username='bill'), 'put')
+        with self.assertNumQueries(0):
+            self.assertTrue(permission.has_object_permission(
+                request, None, self.groups[4]))
+
+    def test_anonymous_user(self):
+        request = self.request(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertFalse(CustomBillAPIPermission().has_permission(
+                request, None))
+            self.assertFalse(CustomGroupDetailAPIPermission()
+                    .has_object_permission(request, None, self.groups[0]))
+        self.assertTrue(CustomUserAPIPermission().has_permission(
+            self.request(AnonymousUser(), 'post'), None))
+
+    def test_memo_follows_request_user(self):
+        request = self.request(self.user)
+        permission = CustomGroupDetailAPIPermission()
+        self.assertTrue(
+                permission.has_object_permission(request, None, self.groups[0]))
+        request.user = User.objects.get(username='sam')
+        request.user.is_staff = False
+        self.assertFalse(
+                permission.has_object_permission(request, None, self.groups[0]))
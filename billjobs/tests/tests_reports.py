@@ -0,0 +1,260 @@
+import datetime
+from unittest import mock
+from decimal import Decimal
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from billjobs.models import Bill, BillLine, ClosedPeriod, CoworkerRollup, \
+        Service
+from billjobs.reports import add_months, close_period, \
+        compute_month_totals, month_periods, precompute_reports, \
+        revenue_by_coworker, revenue_by_month, revenue_by_service, \
+        unpaid_aging
+
+
+class ReportsTestCase(TestCase):
+    ''' Test reports are computed with aggregates and cached by month '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        cache.clear()
+
+    def expected_month(self, period):
+        bills = [bill for bill in Bill.objects.all()
+                if bill.billing_date.strftime('%Y-%m') == period]
+        return dict(period=period, bill_count=len(bills),
+                billed=sum(bill.amount for bill in bills),
+                unpaid=sum(bill.amount for bill in bills if not bill.isPaid))
+
+    def test_month_periods(self):
+        self.assertEqual(month_periods('2016-11', '2017-02'),
+                ['2016-11', '2016-12', '2017-01', '2017-02'])
+        self.assertEqual(add_months('2017-01', -1), '2016-12')
+        self.assertEqual(add_months('2017-01', 12), '2018-01')
+
+    def test_revenue_by_month(self):
+        periods = month_periods('2014-03', '2014-05')
+        # closed periods, then months aggregated from bills
+        with self.assertNumQueries(2):
+            months = revenue_by_month('2014-03', '2014-05')
+        self.assertEqual(months,
+                [self.expected_month(period) for period in periods])
+        self.assertEqual(months[0]['bill_count'], 0)
+
+    def test_revenue_by_service(self):
+        lines = BillLine.objects.filter(bill__billing_date__year=2014,
+                bill__billing_date__month=4)
+        services = revenue_by_service('2014-04')
+        self.assertEqual(sum(row['line_count'] for row in services),
+                lines.count())
+        self.assertEqual(sum(row['billed'] for row in services),
+                sum(line.total for line in lines))
+        self.assertEqual([row['reference'] for row in services],
+                sorted(set(line.reference for line in lines)))
+
+    def test_revenue_by_coworker(self):
+        bill = Bill.objects.get(pk=1)
+        coworkers = revenue_by_coworker('2014-04')
+        self.assertEqual(len(coworkers), 1)
+        self.assertEqual(coworkers[0]['user_id'], bill.user_id)
+        self.assertEqual(coworkers[0]['billed'], bill.amount)
+        self.assertEqual(coworkers[0]['unpaid'], bill.amount)
+
+    def test_unpaid_aging(self):
+        today = datetime.date(2014, 6, 1)
+        Bill.objects.filter(billing_date__gt=today).update(isPaid=True)
+        april, may = Bill.objects.get(pk=1), Bill.objects.get(pk=2)
+        aging = unpaid_aging(today)
+        self.assertEqual([bucket['label'] for bucket in aging],
+                ['0-30', '31-60', '61-90', '90+'])
+        self.assertEqual([bucket['bill_count'] for bucket in aging],
+                [1, 1, 0, 0])
+        self.assertEqual(aging[0]['unpaid'], may.amount)
+        self.assertEqual(aging[1]['unpaid'], april.amount)
+        self.assertEqual(aging[3]['unpaid'], 0)
+
+    def test_report_is_read_from_cache(self):
+        revenue_by_month('2014-01', '2014-12')
+        revenue_by_service('2014-04')
+        revenue_by_coworker('2014-04')
+        with self.assertNumQueries(0):
+            revenue_by_month('2014-01', '2014-12')
+            revenue_by_service('2014-04')
+            revenue_by_coworker('2014-04')
+        # only missing months are computed
+        with self.assertNumQueries(2):
+            months = revenue_by_month('2014-01', '2015-01')
+        self.assertEqual(months[-1], self.expected_month('2015-01'))
+
+    def test_only_missing_months_are_aggregated(self):
+        revenue_by_month('2014-05', '2014-12')
+        with mock.patch('billjobs.reports.compute_month_totals',
+                wraps=compute_month_totals) as compute:
+            months = revenue_by_month('2014-04', '2015-01')
+        compute.assert_called_once_with(['2014-04', '2015-01'])
+        self.assertEqual(months[0], self.expected_month('2014-04'))
+        self.assertEqual(months[-1], self.expected_month('2015-01'))
+        # bills of months in between are not read
+        self.assertEqual(
+                sorted(compute_month_totals(['2014-04', '2015-01'])),
+                ['2014-04', '2015-01'])
+
+    def test_bill_change_invalidate_its_month(self):
+        revenue_by_month('2014-04', '2014-05')
+        line = BillLine.objects.filter(bill_id=1).first()
+        line.quantity += 1
+        line.save()
+        with self.assertNumQueries(2):
+            months = revenue_by_month('2014-04', '2014-05')
+        self.assertEqual(months[0], self.expected_month('2014-04'))
+        revenue_by_coworker('2014-04')
+        Bill.objects.get(pk=1).delete()
+        self.assertEqual(revenue_by_coworker('2014-04'), [])
+
+    def test_new_bill_invalidate_current_month(self):
+        period = datetime.date.today().strftime('%Y-%m')
+        revenue_by_coworker(period)
+        bill = Bill.objects.create(user=User.objects.get(username='bill'))
+        BillLine.objects.create(bill=bill, service=Service.objects.get(pk=1),
+                quantity=2)
+        coworkers = revenue_by_coworker(period)
+        self.assertEqual(len(coworkers), 1)
+        self.assertEqual(coworkers[0]['unpaid'],
+                Bill.objects.get(pk=bill.pk).amount)
+
+    def test_precompute_reports(self):
+        self.assertEqual(precompute_reports('2014-01', '2014-12'), 12)
+        with self.assertNumQueries(0):
+            revenue_by_month('2014-01', '2014-12')
+            revenue_by_service('2014-04')
+            revenue_by_coworker('2014-05')
+        out = StringIO()
+        with mock.patch('billjobs.management.commands.precompute_reports'
+                '.is_shared_cache', return_value=True):
+            call_command('precompute_reports', '--first=2014-01',
+                    '--last=2014-06', stdout=out)
+            with self.assertRaises(CommandError):
+                call_command('precompute_reports', '--first=2014')
+        self.assertIn('6 closed months', out.getvalue())
+
+    def test_precompute_reports_needs_shared_cache(self):
+        # tests use the local memory cache of their own process
+        with self.assertRaisesRegex(CommandError, 'BILLJOBS_REPORTS_CACHE'):
+            call_command('precompute_reports', stdout=StringIO())
+
+    def test_closed_months_expire(self):
+        with mock.patch.object(cache, 'set') as cache_set:
+            revenue_by_service('2014-04')
+            revenue_by_service(datetime.date.today().strftime('%Y-%m'))
+        self.assertEqual([call[0][2] for call in cache_set.call_args_list],
+                [86400, 300])
+
+    def test_admin_reports_view(self):
+        self.client.force_login(User.objects.get(username='bill'))
+        response = self.client.get('/admin/billjobs/bill/')
+        self.assertContains(response, '/admin/billjobs/bill/reports/')
+        response = self.client.get('/admin/billjobs/bill/reports/',
+                {'period': '2014-04'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['period'], '2014-04')
+        self.assertEqual(len(response.context['months']), 60)
+        self.assertEqual(response.context['months'][-1],
+                self.expected_month('2014-04'))
+
+    def test_admin_reports_view_needs_permission(self):
+        user = User.objects.get(username='steve')
+        user.is_superuser = False
+        user.save()
+        user.user_permissions.clear()
+        user.groups.clear()
+        self.client.force_login(user)
+        response = self.client.get('/admin/billjobs/bill/reports/')
+        self.assertEqual(response.status_code, 403)
+
+
+class ClosedPeriodTestCase(TestCase):
+    ''' Test reports of closed months are read from rollups '''
+    fixtures = ['dev_model_010_user.yaml', 'dev_model_020_userprofile.yaml',
+            'dev_model_030_service.yaml', 'dev_model_040_bill.yaml',
+            'dev_model_050_billline.yaml']
+
+    def setUp(self):
+        cache.clear()
+        self.live = dict(
+                months=revenue_by_month('2014-04', '2014-05'),
+                services=revenue_by_service('2014-04'),
+                coworkers=revenue_by_coworker('2014-04'))
+        for period in ('2014-04', '2014-05'):
+            close_period(period)
+        cache.clear()
+
+    def reports(self):
+        return dict(
+                months=revenue_by_month('2014-04', '2014-05'),
+                services=revenue_by_service('2014-04'),
+                coworkers=revenue_by_coworker('2014-04'))
+
+    def test_reports_are_read_from_rollups(self):
+        # one query for months, two for services and coworkers
+        with self.assertNumQueries(5):
+            reports = self.reports()
+        self.assertEqual(reports, self.live)
+
+    def test_period_is_closed_once(self):
+        self.assertIsNone(close_period('2014-04'))
+        self.assertEqual(ClosedPeriod.objects.count(), 2)
+
+    def test_payment_updates_rollups(self):
+        bill = Bill.objects.get(pk=1)
+        bill.isPaid = True
+        bill.save()
+        self.assertEqual(ClosedPeriod.objects.get(period='2014-04').unpaid, 0)
+        self.assertEqual(CoworkerRollup.objects.get(
+            closed_period__period='2014-04', user_id=bill.user_id).unpaid, 0)
+        self.assertEqual(self.reports()['months'][0]['billed'],
+                self.live['months'][0]['billed'])
+
+    def test_payment_is_counted_once(self):
+        first = Bill.objects.get(pk=1)
+        second = Bill.objects.get(pk=1)
+        for bill in (first, second):
+            bill.isPaid = True
+            bill.save()
+        self.assertEqual(ClosedPeriod.objects.get(period='2014-04').unpaid, 0)
+        self.assertEqual(CoworkerRollup.objects.get(
+            closed_period__period='2014-04', user_id=first.user_id).unpaid, 0)
+        second.isPaid = False
+        second.save()
+        first.isPaid = False
+        first.save()
+        self.assertEqual(ClosedPeriod.objects.get(period='2014-04').unpaid,
+                first.amount)
+
+    def test_bill_change_reopens_period(self):
+        line = BillLine.objects.filter(bill_id=1).first()
+        line.quantity += 1
+        line.save()
+        self.assertFalse(ClosedPeriod.objects.filter(period='2014-04').exists())
+        self.assertTrue(ClosedPeriod.objects.filter(period='2014-05').exists())
+        bill = Bill.objects.get(pk=1)
+        self.assertEqual(self.reports()['months'][0]['billed'], bill.amount)
+        Bill.objects.get(pk=2).delete()
+        self.assertFalse(ClosedPeriod.objects.exists())
+
+    def test_close_period_command(self):
+        ClosedPeriod.objects.all().delete()
+        out = StringIO()
+        call_command('close_period', '--period=2014-04', stdout=out)
+        call_command('close_period', '--period=2014-04', stdout=out)
+        self.assertEqual(out.getvalue(),
+                'Closed 2014-04 with 1 bills\n2014-04 was already closed\n')
+        with self.assertRaises(CommandError):
+            call_command('close_period', '--period=April')
+        with self.assertRaises(CommandError):
+            call_command('close_period', '--period={}'.format(
+                datetime.date.today().strftime('%Y-%m')))
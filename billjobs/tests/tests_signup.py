@@ -0,0 +1,78 @@
+from unittest import mock
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import TestCase
+from billjobs import views
+from billjobs.cache import FORCE_USER_GROUP_KEY, invalidate_force_user_group
+from billjobs.models import UserProfile
+
+
+@mock.patch('billjobs.cache.BILLJOBS_FORCE_USER_GROUP', 'coworkers')
+class SignupTestCase(TestCase):
+    ''' Test signup saves user, group and profile at once '''
+
+    def setUp(self):
+        invalidate_force_user_group()
+        self.group = Group.objects.create(name='coworkers')
+        self.data = {
+                'username': 'ada', 'password': 'secret',
+                'first_name': 'Ada', 'last_name': 'Lovelace',
+                'email': 'ada@example.org', 'billing_address': 'London',
+                }
+
+    def signup(self, **data):
+        self.data.update(data)
+        return self.client.post('/billjobs/signup/', self.data)
+
+    def test_signup_save_forced_properties(self):
+        response = self.signup()
+        self.assertRedirects(response, '/billjobs/signup-success/')
+        user = User.objects.get(username='ada')
+        self.assertTrue(user.is_staff)
+        self.assertEqual(list(user.groups.all()), [self.group])
+        self.assertEqual(UserProfile.objects.get(user=user).billing_address,
+                'London')
+
+    def test_group_is_read_once(self):
+        self.signup()
+        with mock.patch('django.contrib.auth.models.Group.objects') as groups:
+            self.signup(username='grace')
+        self.assertFalse(groups.method_calls)
+        self.assertEqual(list(User.objects.get(username='grace').groups.all()),
+                [self.group])
+
+    def test_group_change_invalidate_cache(self):
+        self.signup()
+        self.group.delete()
+        group = Group.objects.create(name='coworkers')
+        self.signup(username='grace')
+        self.assertEqual(list(User.objects.get(username='grace').groups.all()),
+                [group])
+
+    def test_stale_group_is_read_again(self):
+        stale_id = self.group.id
+        self.group.delete()
+        group = Group.objects.create(name='coworkers')
+        # id cached by a process which did not see the group change
+        cache.set(FORCE_USER_GROUP_KEY, stale_id, None)
+        save_signup = views.save_signup
+
+        def save(user_form, profile_form, group_id):
+            if group_id == stale_id:
+                # SQLite does not check foreign keys
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return save_signup(user_form, profile_form, group_id)
+
+        with mock.patch('billjobs.views.save_signup', save):
+            response = self.signup()
+        self.assertRedirects(response, '/billjobs/signup-success/')
+        self.assertEqual(list(User.objects.get(username='ada').groups.all()),
+                [group])
+
+    def test_failed_signup_save_nothing(self):
+        with mock.patch('billjobs.views.UserProfileForm.save',
+                side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.signup()
+        self.assertFalse(User.objects.filter(username='ada').exists())
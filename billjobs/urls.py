@@ -1,10 +1,18 @@
 from django.conf.urls import url
-from . import views
+from . import api, views
+from .settings import BILLJOBS_METRICS
 
 urlpatterns = [
         url(r'^generate_pdf/(?P<bill_id>\d+)$', views.generate_pdf,
             name='generate-pdf'),
         url(r'^signup/$', views.signup, name='billjobs_signup'),
         url(r'^signup-success/$', views.signup_success,
-            name='billjobs_signup_success')
+            name='billjobs_signup_success'),
+        url(r'^api/1.0/bills/$', api.BillAPI.as_view(), name='bills-api'),
+        url(r'^api/1.0/bills/(?P<pk>\d+)/$', api.BillDetailAPI.as_view(),
+            name='bills-detail-api'),
         ]
+
+if BILLJOBS_METRICS:
+    urlpatterns.append(
+            url(r'^metrics$', views.metrics, name='billjobs_metrics'))
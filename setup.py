@@ -15,6 +15,7 @@ setup(
     install_requires=[
         "django > 1.10",
         "reportlab == 3.4.0",
+        "djangorestframework >= 3.6",
     ],
     license='X11 License',
     description='A django billing app for coworking space.',